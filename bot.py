@@ -6,53 +6,288 @@ from discord.ext import commands
 import os
 import json
 import logging
+import hashlib
+import math
+import time
 from dotenv import load_dotenv
 import asyncio
-
-# Logging setup
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger('discord_bot')
+from pipeline import MessagePipeline
+from scheduler import Scheduler
+from outbound import OutboundScheduler
+from bot_config import BotConfig, member_cache_flags, watch_config
+from log_setup import setup_logging
+from ipc import IPCClient
+import metrics
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 
 # Load config
-with open('config.json', 'r', encoding='utf-8') as f:
+CONFIG_FILE = 'config.json'
+with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
     CONFIG = json.load(f)
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Set by launcher.py when this process is one cluster of a multi-process deployment
+CLUSTER_ID = os.getenv('BOT_CLUSTER_ID')
+CLUSTER_COUNT = int(os.getenv('BOT_CLUSTER_COUNT', '1'))
+SHARD_IDS = [int(i) for i in os.getenv('BOT_SHARD_IDS', '').split(',') if i]
+SHARD_COUNT = int(os.getenv('BOT_SHARD_COUNT', '0')) or CONFIG.get("sharding", {}).get("shard_count")
+IPC_PORT = os.getenv('BOT_IPC_PORT')
+# JSON state and log files each process writes on its own; a guild stays on one cluster while the shard layout is unchanged
+CLUSTER_LOCAL_FILES = {
+    "ticket_store": "tickets.db",
+    "training_store": "trainings.json",
+    "scheduler_store": "scheduled_jobs.json",
+    "ghost_webhook_store": None,
+}
+
+def cluster_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.cluster{CLUSTER_ID}{ext}"
+
+if CLUSTER_ID is not None:
+    for key, default in CLUSTER_LOCAL_FILES.items():
+        if CONFIG.get(key, default):
+            CONFIG[key] = cluster_path(CONFIG.get(key, default))
+    logging_config = CONFIG.setdefault("logging", {})
+    logging_config["file"] = cluster_path(logging_config.get("file", "bot.log"))
+
+# Logging setup: records are queued and written by a background thread
+setup_logging(CONFIG.get("logging", {}))
+logger = logging.getLogger('discord_bot')
+
+# Cog modules sit next to bot.py, which is on sys.path
+COGS = CONFIG.get("cogs") or [
+    'moderation',
+    'roles',
+    'tickets',
+    'training',
+    'event_tracker',
+    'troll',
+]
+# Gateway intents each cog's listeners and commands rely on
+COG_INTENTS = {
+    'moderation': {'members'},
+    'roles': {'members'},
+    'tickets': {'guild_messages', 'message_content'},
+    'training': set(),
+    'event_tracker': {'members', 'moderation', 'voice_states', 'guild_messages', 'message_content'},
+    'troll': {'guild_messages', 'message_content', 'voice_states', 'webhooks'},
+}
+# Needed by the bot itself: guild/channel/role cache and ! prefix commands
+BASE_INTENTS = {'guilds', 'guild_messages', 'message_content'}
+
+def build_intents():
+    """All intents, or (the default "minimal" profile) only what the loaded cogs need.
+
+    Presences and typing events are never needed, which is most of a large guild's traffic.
+    """
+    if CONFIG.get("intents", "minimal") == "all":
+        return discord.Intents.all()
+    intents = discord.Intents.none()
+    for flag in BASE_INTENTS.union(*(COG_INTENTS.get(cog, set()) for cog in COGS)):
+        setattr(intents, flag, True)
+    return intents
+
+def shard_options():
+    """AutoShardedBot settings: the shard range from launcher.py, or every shard in this process when sharding is enabled."""
+    if SHARD_IDS:
+        return commands.AutoShardedBot, {"shard_ids": SHARD_IDS, "shard_count": SHARD_COUNT}
+    if CONFIG.get("sharding", {}).get("enabled"):
+        return commands.AutoShardedBot, {"shard_count": SHARD_COUNT}
+    return commands.Bot, {}
+
+intents = build_intents()
+bot_class, shard_kwargs = shard_options()
+bot = bot_class(
+    command_prefix='!',
+    intents=intents,
+    member_cache_flags=member_cache_flags(CONFIG.get("member_cache", "all"), intents),
+    chunk_guilds_at_startup=CONFIG.get("chunk_guilds_at_startup", True),
+    # Delete/edit logging reads its own compact cache, so few full Message objects are kept
+    max_messages=CONFIG.get("max_messages", 200),
+    **shard_kwargs,
+)
 bot.CONFIG = CONFIG
+# Typed per-guild settings; replaced whenever config.json changes, so read it through bot.config each time
+bot.config = BotConfig(CONFIG)
+# Connection to the launcher's state hub when clustered; cogs fall back to local state when None
+bot.ipc = None
+bot.cluster_id = CLUSTER_ID
+bot.cluster_count = CLUSTER_COUNT
+# Cogs register message handlers here instead of adding their own on_message listeners
+bot.message_pipeline = MessagePipeline(bot)
+# Prometheus metrics; handlers are only wrapped and served when metrics.enabled is set
+bot.metrics = metrics.MetricsRegistry()
+METRICS_CONFIG = CONFIG.get("metrics", {})
+# Persistent delayed jobs (e.g. temp role expiry); cogs register a handler per job kind
+bot.scheduler = Scheduler(CONFIG.get("scheduler_store", "scheduled_jobs.json"))
+# Cogs queue their own API calls here by priority instead of sending directly
+OUTBOUND_CONFIG = CONFIG.get("outbound", {})
+bot.outbound = OutboundScheduler(
+    concurrency=OUTBOUND_CONFIG.get("concurrency", 10),
+    global_per_second=OUTBOUND_CONFIG.get("global_per_second", 45),
+    bucket_limits={kind: tuple(limit) for kind, limit in OUTBOUND_CONFIG.get("buckets", {}).items()},
+)
 
-@bot.event
-async def on_ready():
-    logger.info(f'{bot.user} has connected to Discord!')
-    # Load cogs
-    cogs = [
-        'cogs.moderation',
-        'cogs.roles',
-        'cogs.tickets',
-        'cogs.training',
-        'cogs.logging',
-        'cogs.troll',
+# Hash of the last command tree synced to Discord, so restarts skip unchanged syncs
+COMMAND_HASH_FILE = CONFIG.get("command_hash_file", "command_tree.sha256")
+
+async def load_cog(cog):
+    start = time.perf_counter()
+    try:
+        await bot.load_extension(cog)
+        logger.info(f"Loaded cog: {cog} ({(time.perf_counter() - start) * 1000:.0f}ms)")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to load cog {cog}: {e}")
+        return False
+
+def command_tree_hash():
+    payload = []
+    for command in bot.tree.get_commands():
+        try:
+            payload.append(command.to_dict(bot.tree))
+        except TypeError:
+            # discord.py < 2.4 takes no tree argument
+            payload.append(command.to_dict())
+    serialized = json.dumps([bot.application_id, payload], sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+async def sync_commands_if_changed():
+    digest = command_tree_hash()
+    try:
+        with open(COMMAND_HASH_FILE, 'r', encoding='utf-8') as f:
+            if f.read().strip() == digest:
+                logger.info("Slash commands unchanged, skipping sync.")
+                return
+    except FileNotFoundError:
+        pass
+    try:
+        synced = await bot.tree.sync()
+    except discord.DiscordException as e:
+        # No hash written, so the next start tries again
+        logger.error(f"Slash command sync failed: {e}")
+        return
+    with open(COMMAND_HASH_FILE, 'w', encoding='utf-8') as f:
+        f.write(digest)
+    logger.info(f"Synced {len(synced)} global slash commands.")
+
+def shard_stats():
+    """``[(shard_id, latency_ms, guild_count)]`` for the shards this process runs."""
+    latencies = getattr(bot, "latencies", None) or [(bot.shard_id or 0, bot.latency)]
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+    return [
+        (shard_id, round(latency * 1000) if math.isfinite(latency) else None, guild_counts.get(shard_id, 0))
+        for shard_id, latency in sorted(latencies)
     ]
-    for cog in cogs:
+
+async def publish_shard_stats():
+    # Lets !shards on any cluster show the whole deployment
+    await bot.wait_until_ready()
+    while not bot.is_closed():
         try:
-            await bot.load_extension(cog)
-            logger.info(f"Loaded cog: {cog}")
+            await bot.ipc.set(f"stats:{CLUSTER_ID}", {"shards": shard_stats(), "updated": time.time()})
         except Exception as e:
-            logger.error(f"Failed to load cog {cog}: {e}")
-    # Sync global slash commands
-    synced = await bot.tree.sync()
-    logger.info(f"Synced {len(synced)} global slash commands.")
+            logger.error(f"Could not publish shard stats: {e}")
+        await asyncio.sleep(30)
+
+def owns_guild(guild_id: int) -> bool:
+    if not SHARD_IDS:
+        return True  # Not clustered: every guild is ours
+    # Discord's shard formula, so this holds before the guild has loaded
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+bot.owns_guild = owns_guild
+
+def adopt_handed_off_job(key: str, entry):
+    if entry is None or not owns_guild(entry["data"]["guild_id"]):
+        return
+    bot.scheduler.adopt(entry)
+    task = asyncio.create_task(bot.ipc.delete(key))
+    bot.handoff_tasks.add(task)
+    task.add_done_callback(bot.handoff_tasks.discard)
+
+async def hand_off_scheduled_jobs():
+    """Move scheduled jobs to the cluster that serves their guild, through the hub.
+
+    Each cluster keeps its own scheduler file, so after a shard layout change a
+    guild's temp role and training jobs would otherwise stay with a process that
+    no longer sees the guild.
+    """
+    bot.handoff_tasks = set()
+    await bot.ipc.watch("job:", adopt_handed_off_job)
+    for key, entry in (await bot.ipc.items("job:")).items():
+        adopt_handed_off_job(key, entry)
+    foreign = bot.scheduler.take(lambda job: "guild_id" in job.data and not owns_guild(job.data["guild_id"]))
+    for job in foreign:
+        await bot.ipc.set(f"job:{job.id}", job.to_dict())
+    if foreign:
+        logger.info(f"Handed {len(foreign)} scheduled job(s) to the clusters now serving their guilds")
+
+def collect_shard_metrics():
+    latency = bot.metrics.gauge("bot_shard_latency_seconds", "Gateway heartbeat latency", ("shard",))
+    guilds = bot.metrics.gauge("bot_shard_guilds", "Guilds served by the shard", ("shard",))
+    for shard_id, latency_ms, guild_count in shard_stats():
+        if latency_ms is not None:
+            latency.set(str(shard_id), value=latency_ms / 1000)
+        guilds.set(str(shard_id), value=guild_count)
+
+async def start_metrics():
+    # Wrap after the cogs are loaded so their listeners are picked up
+    metrics.instrument_listeners(bot, bot.metrics)
+    metrics.instrument_commands(bot, bot.metrics)
+    metrics.instrument_http(bot, bot.metrics)
+    bot.metrics.collectors.append(metrics.pipeline_collector(bot.message_pipeline, bot.metrics))
+    bot.metrics.collectors.append(metrics.outbound_collector(bot.outbound, bot.metrics))
+    bot.metrics.collectors.append(collect_shard_metrics)
+    tracker = bot.get_cog("EventTracker")
+    if tracker is not None:
+        bot.metrics.collectors.append(metrics.event_tracker_collector(tracker, bot.metrics))
+    # Clusters on one host each take the next port
+    port = METRICS_CONFIG.get("port", 9108) + int(CLUSTER_ID or 0)
+    bot.metrics_server = metrics.MetricsServer(bot.metrics, METRICS_CONFIG.get("host", "127.0.0.1"), port)
+    await bot.metrics_server.start()
+    bot.loop_lag_task = asyncio.create_task(metrics.sample_loop_lag(bot.metrics, METRICS_CONFIG.get("loop_lag_interval", 0.5)))
+
+def apply_config(config):
+    # Only settings read through bot.config take effect; the command tree is left alone
+    bot.config = config
+
+async def setup_hook():
+    # Runs once per process, before connecting; on_ready fires again on every reconnect
+    start = time.perf_counter()
+    if IPC_PORT:
+        bot.ipc = IPCClient("127.0.0.1", int(IPC_PORT))
+        await bot.ipc.connect()
+        bot.shard_stats_task = asyncio.create_task(publish_shard_stats())
+        await hand_off_scheduled_jobs()
+    # Jobs that fell due while offline would otherwise fire before the guild cache exists
+    bot.scheduler.start(ready=bot.wait_until_ready)
+    reload_interval = CONFIG.get("config_reload_interval", 5)
+    if reload_interval:
+        bot.config_watch_task = asyncio.create_task(watch_config(CONFIG_FILE, reload_interval, apply_config))
+    loaded = await asyncio.gather(*(load_cog(cog) for cog in COGS))
+    cogs_done = time.perf_counter()
+    if METRICS_CONFIG.get("enabled"):
+        await start_metrics()
+    # Commands are global, so only the first cluster syncs them
+    if CLUSTER_ID in (None, "0"):
+        await sync_commands_if_changed()
+    done = time.perf_counter()
+    logger.info(
+        f"Startup: {sum(loaded)}/{len(COGS)} cogs in {(cogs_done - start) * 1000:.0f}ms, "
+        f"command sync {(done - cogs_done) * 1000:.0f}ms, total {(done - start) * 1000:.0f}ms"
+    )
+
+bot.setup_hook = setup_hook
+
+@bot.event
+async def on_ready():
+    logger.info(f'{bot.user} has connected to Discord!')
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -66,14 +301,49 @@ async def on_command_error(ctx, error):
         logger.error(f"An error occurred: {error}")
         await ctx.send("An error occurred while processing the command.")
 
+@bot.event
+async def on_guild_channel_delete(channel):
+    bot.config.forget_channel(channel.id)
+
 @bot.event
 async def on_message(message):
-    if message.author.bot:
-        return
-    await bot.process_commands(message)
+    await bot.message_pipeline.dispatch(message)
+
+@bot.command(name="pipelinestats")
+@commands.is_owner()
+async def pipelinestats(ctx):
+    """Show per-stage timing counters for the message pipeline."""
+    await ctx.send(f"```\n{bot.message_pipeline.report()}\n```")
+
+@bot.command(name="outboundstats")
+@commands.is_owner()
+async def outboundstats(ctx):
+    """Show queue depth, drops and waits per priority for outbound API calls."""
+    await ctx.send(f"```\n{bot.outbound.report()}\n```")
+
+@bot.command(name="shards")
+@commands.is_owner()
+async def shards(ctx):
+    """Show latency and guild count per shard, for every cluster when clustered."""
+    clusters = {CLUSTER_ID or "0": shard_stats()}
+    if bot.ipc is not None:
+        for key, stats in (await bot.ipc.items("stats:")).items():
+            cluster = key.split(":", 1)[1]
+            if cluster != CLUSTER_ID:
+                clusters[cluster] = stats["shards"]
+    lines = []
+    for cluster in sorted(clusters, key=int):
+        for shard_id, latency_ms, guild_count in clusters[cluster]:
+            latency = f"{latency_ms}ms" if latency_ms is not None else "n/a"
+            lines.append(f"cluster {cluster} shard {shard_id}: {latency}, {guild_count} guilds")
+    await ctx.send("```\n" + "\n".join(lines) + "\n```")
 
 async def main():
-    await bot.start(TOKEN)
+    try:
+        await bot.start(TOKEN)
+    finally:
+        # Scheduled job changes from the last second are still waiting to be written
+        await bot.scheduler.stop()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
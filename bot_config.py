@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import discord
+
+logger = logging.getLogger('discord_bot')
+
+# Per-guild channel settings, resolved to channel objects by BotConfig.channel()
+GUILD_CHANNELS = ("log_channel", "training_channel", "transcript_log_channel")
+
+class ConfigError(ValueError):
+    """A config.json value has the wrong type."""
+
+def _id(value, where: str) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ConfigError(f"{where} must be an ID, got {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"{where} must be an ID, got {value!r}") from None
+
+def _timezone(name, where: str):
+    if name is None:
+        return None
+    if not isinstance(name, str):
+        raise ConfigError(f"{where} must be a timezone name, got {name!r}")
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r} in {where}, using the host timezone")
+        return None
+
+class GuildConfig:
+    """One guild's settings, with ``guild_defaults`` already filled in."""
+    __slots__ = ("guild_id", "channel_ids", "support_role_id", "timezone")
+
+    def __init__(self, guild_id: Optional[int], section: dict, defaults: Optional["GuildConfig"], where: str):
+        if not isinstance(section, dict):
+            raise ConfigError(f"{where} must be an object, got {section!r}")
+        self.guild_id = guild_id
+        self.channel_ids = {}  # Maps channel setting -> channel id or None
+        for key in GUILD_CHANNELS:
+            if key in section:
+                self.channel_ids[key] = _id(section[key], f"{where}.{key}")
+            else:
+                self.channel_ids[key] = defaults.channel_ids[key] if defaults else None
+        if "support_role" in section:
+            self.support_role_id = _id(section["support_role"], f"{where}.support_role")
+        else:
+            self.support_role_id = defaults.support_role_id if defaults else None
+        if "timezone" in section:
+            self.timezone = _timezone(section["timezone"], f"{where}.timezone")
+        else:
+            self.timezone = defaults.timezone if defaults else None
+
+class BotConfig:
+    """Typed view of config.json, with per-guild sections turned into int-keyed maps on load.
+
+    ``get()`` reads top-level settings. Settings used on every event (log channels,
+    training channel, timezones, support role) come precomputed from ``guild()``, and
+    ``channel()`` caches resolved channels until they're deleted or the file is
+    reloaded. Older configs with ``log_channels``/``training_timezones``/``timezone``
+    are read into the same sections.
+    """
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        defaults = raw.get("guild_defaults", {})
+        if not isinstance(defaults, dict):
+            raise ConfigError(f"guild_defaults must be an object, got {defaults!r}")
+        self.defaults = GuildConfig(None, {"timezone": raw.get("timezone"), **defaults}, None, "guild_defaults")
+        sections = {}
+        for guild_id, channel_id in raw.get("log_channels", {}).items():
+            sections.setdefault(guild_id, {})["log_channel"] = channel_id
+        for guild_id, name in raw.get("training_timezones", {}).items():
+            sections.setdefault(guild_id, {})["timezone"] = name
+        for guild_id, section in raw.get("guilds", {}).items():
+            if not isinstance(section, dict):
+                raise ConfigError(f"guilds.{guild_id} must be an object, got {section!r}")
+            sections.setdefault(guild_id, {}).update(section)
+        self.guilds = {}  # Maps guild id -> GuildConfig
+        for key, section in sections.items():
+            guild_id = _id(key, f"guild id {key!r}")
+            self.guilds[guild_id] = GuildConfig(guild_id, section, self.defaults, f"guilds.{key}")
+        self._channels = {}  # Maps (guild id, channel setting) -> resolved channel
+
+    @classmethod
+    def load(cls, path: str) -> "BotConfig":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def get(self, key: str, default=None):
+        return self.raw.get(key, default)
+
+    def guild(self, guild_id: int) -> GuildConfig:
+        return self.guilds.get(guild_id, self.defaults)
+
+    def channel(self, guild, setting: str):
+        """The channel ``setting`` (e.g. ``"log_channel"``) points to in ``guild``, or None."""
+        key = (guild.id, setting)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel_id = self.guild(guild.id).channel_ids[setting]
+            channel = guild.get_channel(channel_id) if channel_id else None
+            if channel is not None:
+                self._channels[key] = channel
+        return channel
+
+    def forget_channel(self, channel_id: int):
+        for key, channel in list(self._channels.items()):
+            if channel.id == channel_id:
+                del self._channels[key]
+
+def member_cache_flags(policy: str, intents: discord.Intents) -> discord.MemberCacheFlags:
+    """Which members stay cached: "all" (every chunked member), "joined", "voice" or "none".
+
+    Anything but "all" should be combined with chunk_guilds_at_startup=false. Cogs
+    that need members the cache doesn't hold get them another way: the shared
+    guild index reads each unchunked guild's member list once without caching it,
+    /massrole chunks the guild on demand, and expiring temp roles fetch the member.
+    """
+    if policy == "voice":
+        return discord.MemberCacheFlags(voice=True, joined=False)
+    if policy == "joined":
+        return discord.MemberCacheFlags(voice=False, joined=True)
+    if policy == "none":
+        return discord.MemberCacheFlags.none()
+    return discord.MemberCacheFlags.from_intents(intents)
+
+async def watch_config(path: str, interval: float, apply):
+    """Poll ``path`` and call ``apply(config)`` with a fresh BotConfig after each valid change.
+
+    A file that fails to parse or validate is logged and the current config kept.
+    """
+    def stamp():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    last = stamp()
+    while True:
+        await asyncio.sleep(interval)
+        current = stamp()
+        if current is None or current == last:
+            continue
+        last = current
+        try:
+            config = BotConfig.load(path)
+        except Exception as e:
+            logger.error(f"Not reloading {path}: {e}")
+            continue
+        apply(config)
+        logger.info(f"Reloaded {path}")
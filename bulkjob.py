@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+class BulkJob:
+    """Apply an async ``action`` to many items as a cancellable background job.
+
+    A fixed pool of ``concurrency`` workers pulls from one iterator, so memory and
+    in-flight requests stay bounded however many items there are. Items for which
+    ``skip(item)`` is true (already in the desired state) cost no request.
+    ``on_progress(job)`` is awaited every ``progress_interval`` seconds.
+    """
+
+    def __init__(self, items, action, *, skip=None, concurrency: int = 5, on_progress=None, progress_interval: float = 2.0):
+        self.items = list(items)
+        self.total = len(self.items)
+        self.action = action
+        self.skip = skip
+        self.concurrency = concurrency
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.changed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.cancelled = False
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    @property
+    def processed(self) -> int:
+        return self.changed + self.skipped + self.failed
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def summary(self) -> str:
+        state = "cancelled" if self.cancelled else ("finished" if self.done else "running")
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        return (f"{state}: {self.processed}/{self.total} processed in {elapsed:.0f}s — "
+                f"{self.changed} changed, {self.skipped} skipped, {self.failed} failed")
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def _worker(self, iterator):
+        for item in iterator:
+            if self.cancelled:
+                return
+            if self.skip is not None and self.skip(item):
+                self.skipped += 1
+                continue
+            try:
+                await self.action(item)
+                self.changed += 1
+            except Exception:
+                self.failed += 1
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self.on_progress(self)
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        iterator = iter(self.items)
+        reporter = asyncio.create_task(self._report()) if self.on_progress else None
+        try:
+            await asyncio.gather(*(self._worker(iterator) for _ in range(self.concurrency)))
+        finally:
+            self.finished_at = time.monotonic()
+            if reporter:
+                reporter.cancel()
+        if self.on_progress:
+            await self.on_progress(self)
+        return self
+
+async def _mock_guild_run(members: int = 50_000, latency: float = 0.0005):
+    """Run a job over a fake guild where a third of members already have the role."""
+    class FakeMember:
+        __slots__ = ("id", "roles")
+
+        def __init__(self, id):
+            self.id = id
+            self.roles = {1} if id % 3 == 0 else set()
+
+    requests = 0
+
+    async def add_role(member):
+        nonlocal requests
+        requests += 1
+        await asyncio.sleep(latency)
+        if member.id % 1000 == 7:
+            raise RuntimeError("Forbidden")
+        member.roles.add(1)
+
+    guild = [FakeMember(i) for i in range(members)]
+    job = BulkJob(guild, add_role, skip=lambda m: 1 in m.roles, concurrency=5)
+    await job.run()
+    assert job.processed == members and requests == job.changed + job.failed
+    assert all(1 in m.roles for m in guild if m.id % 1000 != 7)
+    print(f"{members} members, {requests} requests: {job.summary()}")
+
+    cancelled = BulkJob([FakeMember(i) for i in range(members)], add_role, concurrency=5)
+    task = cancelled.start()
+    await asyncio.sleep(0.05)
+    cancelled.cancel()
+    await task
+    print(f"cancel after 50ms: {cancelled.summary()}")
+
+if __name__ == "__main__":
+    asyncio.run(_mock_guild_run())
@@ -0,0 +1,75 @@
+import time
+from collections import deque
+
+class RecentIds:
+    """Time-windowed set of recently seen integer ids.
+
+    A FIFO of ``(seen_at, id)`` plus a hash set: lookups are O(1), and ids are
+    evicted oldest-first once they are older than ``window`` seconds or the set
+    holds more than ``max_size`` ids. Unlike clearing the whole set when it gets
+    big, protection never drops out during a burst.
+    """
+
+    def __init__(self, window: float = 60.0, max_size: int = 100_000, clock=time.monotonic):
+        self.window = window
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._order = deque()
+        self._ids = set()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._ids
+
+    def check_and_add(self, key: int) -> bool:
+        """Return True if ``key`` was already seen in the window, otherwise record it."""
+        now = self._clock()
+        self._evict(now)
+        if key in self._ids:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._ids.add(key)
+        self._order.append((now, key))
+        return False
+
+    def _evict(self, now: float):
+        order = self._order
+        cutoff = now - self.window
+        while order and (order[0][0] < cutoff or len(order) > self.max_size):
+            self._ids.discard(order.popleft()[1])
+
+def _benchmark(rate: int = 10_000, seconds: int = 10):
+    total = rate * seconds
+    # Every 20th message is redelivered, as happens when two listeners see it
+    stream = [i - 1 if i % 20 == 0 else i for i in range(total)]
+
+    processed = set()
+    start = time.perf_counter()
+    for message_id in stream:
+        key = f"{message_id}_1234567890"
+        if key in processed:
+            continue
+        processed.add(key)
+        if len(processed) > 1000:
+            processed.clear()
+    old = time.perf_counter() - start
+
+    fake_now = [0.0]
+    recent = RecentIds(window=60.0, clock=lambda: fake_now[0])
+    start = time.perf_counter()
+    for n, message_id in enumerate(stream):
+        fake_now[0] = n / rate
+        recent.check_and_add(message_id)
+    new = time.perf_counter() - start
+
+    print(f"set + clear(): {total / old:,.0f} msgs/s ({old / total * 1e9:.0f} ns/msg)")
+    print(f"RecentIds:     {total / new:,.0f} msgs/s ({new / total * 1e9:.0f} ns/msg), "
+          f"{recent.hits} duplicates caught, {len(recent)} ids held")
+
+if __name__ == "__main__":
+    _benchmark()
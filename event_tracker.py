@@ -0,0 +1,437 @@
+import discord
+from discord.ext import commands, tasks
+from discord import app_commands
+import asyncio
+import logging
+import datetime
+import time
+from typing import Optional
+from journal import EventJournal
+from message_cache import MessageContentCache
+from outbound import BACKGROUND, OutboundDropped
+
+log = logging.getLogger('event_logger')
+
+# A log message is flushed once this many seconds have passed since its first entry...
+LOG_FLUSH_INTERVAL = 2.0
+# ...or once it holds this many distinct kinds of event (Discord allows 10 embeds per message)
+LOG_MAX_EMBEDS = 10
+# Entries waiting per log channel; beyond this new ones are only counted, and the count is posted instead
+LOG_QUEUE_SIZE = 500
+# Discord's limits on a single embed description and on all embeds of one message
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_EMBED_CHARS_LIMIT = 6000
+# Log messages still queued this long after their flush are dropped; /journal keeps every event
+LOG_SEND_TTL = 60.0
+# Events shown per page of /journal
+JOURNAL_PAGE_SIZE = 10
+
+class LogEntry:
+    __slots__ = ("title", "description", "color", "created")
+
+    def __init__(self, title, description, color):
+        self.title = title
+        self.description = description
+        self.color = color
+        self.created = datetime.datetime.now(datetime.timezone.utc)
+
+def truncate_description(text: str) -> str:
+    if len(text) > EMBED_DESCRIPTION_LIMIT:
+        return text[:EMBED_DESCRIPTION_LIMIT - 3] + "..."
+    return text
+
+def coalesce_entries(entries):
+    """Merge entries with the same title into one embed, keeping first-seen order."""
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry.title, []).append(entry)
+
+    embeds = []
+    for title, group in groups.items():
+        first = group[0]
+        if len(group) == 1:
+            embeds.append(discord.Embed(title=title, description=truncate_description(first.description), color=first.color, timestamp=first.created))
+            continue
+        span = (group[-1].created - first.created).total_seconds()
+        header = f"**{len(group)} events in {max(1, round(span))}s**"
+        lines = [header]
+        used = len(header)
+        for shown, entry in enumerate(group):
+            more = f"...and {len(group) - shown} more"
+            if used + len(entry.description) + 1 > EMBED_DESCRIPTION_LIMIT - len(more) - 1:
+                lines.append(more)
+                break
+            lines.append(entry.description)
+            used += len(entry.description) + 1
+        embeds.append(discord.Embed(
+            title=f"{title} (x{len(group)})",
+            description="\n".join(lines),
+            color=first.color,
+            timestamp=group[-1].created
+        ))
+    return embeds
+
+def pack_embeds(embeds):
+    """Split embeds into per-message chunks within Discord's count and size limits."""
+    chunk, size = [], 0
+    for embed in embeds:
+        embed_size = len(embed)
+        if chunk and (len(chunk) == LOG_MAX_EMBEDS or size + embed_size > MESSAGE_EMBED_CHARS_LIMIT):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(embed)
+        size += embed_size
+    if chunk:
+        yield chunk
+
+class JournalPager(discord.ui.View):
+    def __init__(self, journal: EventJournal, guild_id: int, user_id: Optional[int], since: float, title: str):
+        super().__init__(timeout=300)
+        self.journal = journal
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.since = since
+        self.title = title
+        self.anchors = [None]  # before_id used to fetch each page seen so far
+        self.rows = []
+
+    async def load(self):
+        self.rows = await self.journal.query(
+            self.guild_id, user_id=self.user_id, since=self.since,
+            before_id=self.anchors[-1], limit=JOURNAL_PAGE_SIZE
+        )
+        self.previous_page.disabled = len(self.anchors) == 1
+        self.next_page.disabled = len(self.rows) < JOURNAL_PAGE_SIZE
+
+    def render(self) -> discord.Embed:
+        lines = [f"<t:{int(ts)}:f> **{kind}**\n{description}" for _, ts, _, _, kind, description in self.rows]
+        embed = discord.Embed(title=self.title, description="\n\n".join(lines) or "No events found.", color=discord.Color.blurple())
+        embed.set_footer(text=f"Page {len(self.anchors)}")
+        embed.description = truncate_description(embed.description)
+        return embed
+
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.anchors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.anchors.append(self.rows[-1][0])
+        await self.load()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+class EventTracker(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.log_queues = {}  # Maps log channel id -> queue of pending LogEntry
+        self.log_workers = {}  # Maps log channel id -> task flushing that queue
+        self.log_dropped = {}  # Maps log channel id -> entries dropped since its last flush
+        self.log_dropped_total = 0
+        self.missing_log_channels = set()  # Log channels already reported as gone
+        self.journal = EventJournal(bot.CONFIG.get("journal_path", "events.db"))
+        self.journal_retention_days = bot.CONFIG.get("journal_retention_days", 90)
+        # Side cache so deletes/edits of messages discord.py no longer caches can still be logged
+        self.message_cache = MessageContentCache(bot.CONFIG.get("message_cache_guild_bytes", 2_000_000))
+
+    async def cog_load(self):
+        await self.journal.open()
+        self.prune_journal.start()
+        self.bot.message_pipeline.register("logging.cache", lambda message: message.guild is not None, self.cache_message)
+
+    async def cog_unload(self):
+        self.bot.message_pipeline.unregister("logging.cache")
+        self.prune_journal.cancel()
+        for worker in self.log_workers.values():
+            worker.cancel()
+        await self.journal.close()
+
+    @tasks.loop(hours=6)
+    async def prune_journal(self):
+        deleted = await self.journal.prune(self.journal_retention_days)
+        if deleted:
+            log.info(f"Pruned {deleted} journal event(s) older than {self.journal_retention_days} days")
+
+    @app_commands.command(name="journal", description="Show logged events for this server, optionally for one member.")
+    @app_commands.describe(member="Only show events involving this member", days="How many days back to look")
+    @app_commands.checks.has_permissions(view_audit_log=True)
+    async def journal_command(self, interaction: discord.Interaction, member: Optional[discord.Member] = None, days: app_commands.Range[int, 1, 365] = 7):
+        title = f"Events for {member.display_name}" if member else "Server events"
+        view = JournalPager(self.journal, interaction.guild.id, member.id if member else None, time.time() - days * 86400, f"{title} (last {days} day(s))")
+        await view.load()
+        await interaction.response.send_message(embed=view.render(), view=view, ephemeral=True)
+
+    def format_account_age(self, created_at: datetime.datetime) -> str:
+        now = datetime.datetime.now(tz=created_at.tzinfo)  # Use the same tz as created_at
+        age = now - created_at
+        years, remainder = divmod(age.days, 365)
+        months, days = divmod(remainder, 30)
+        return f"{years} years, {months} months, {days} days"
+
+    def build_user_embed(self, *, member: discord.abc.User, action: str, emoji_title: str, emoji_desc: str, color: discord.Color) -> discord.Embed:
+        now = datetime.datetime.utcnow()
+        account_age = self.format_account_age(member.created_at)
+
+        embed = discord.Embed(
+            title=f"{emoji_title} Member {action}",
+            description=f"{emoji_desc} {member.mention} has {action.lower()}.",
+            color=color,
+            timestamp=now
+        )
+        embed.add_field(name=":Info: Account Age", value=account_age, inline=False)
+        embed.add_field(name=":member: User Tag", value=member.name, inline=False)
+        embed.set_footer(text=f"🆔 ID: {member.id} • {now.strftime('%I:%M %p')}")
+        if hasattr(member, 'display_avatar'):
+            embed.set_thumbnail(url=member.display_avatar.url)
+        return embed
+
+    def get_log_channel(self, guild: discord.Guild):
+        return self.bot.config.channel(guild, "log_channel")
+
+    async def log_embed(self, guild, title, description, color=discord.Color.blurple(), *, user=None, channel_id=None):
+        self.journal.append(guild.id, title, description, user_id=user.id if user else None, channel_id=channel_id)
+        channel = self.get_log_channel(guild)
+        if channel:
+            queue = self.log_queues.get(channel.id)
+            if queue is None:
+                queue = self.log_queues[channel.id] = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+                self.log_workers[channel.id] = asyncio.create_task(self.flush_log_queue(channel.id, queue))
+            try:
+                queue.put_nowait(LogEntry(title, description, color))
+            except asyncio.QueueFull:
+                # Listeners never wait on a backed-up channel; the next flush posts how many were skipped
+                self.log_dropped[channel.id] = self.log_dropped.get(channel.id, 0) + 1
+                self.log_dropped_total += 1
+
+    async def flush_log_queue(self, channel_id: int, queue: asyncio.Queue):
+        while True:
+            try:
+                await self.flush_log_batch(channel_id, queue)
+            except Exception as e:
+                # A dead worker would leave the queue full and every later entry dropped
+                log.exception(f"Log flush for {channel_id} failed: {e}")
+
+    async def flush_log_batch(self, channel_id: int, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        titles = {batch[0].title}
+        deadline = loop.time() + LOG_FLUSH_INTERVAL
+        while len(titles) < LOG_MAX_EMBEDS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(entry)
+            titles.add(entry.title)
+        dropped = self.log_dropped.pop(channel_id, 0)
+        if dropped:
+            batch.append(LogEntry(
+                "Log Entries Skipped", f"{dropped} event(s) weren't posted because this channel was backed up; `/journal` has them.",
+                discord.Color.dark_grey(),
+            ))
+
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            if channel_id not in self.missing_log_channels:
+                self.missing_log_channels.add(channel_id)
+                log.warning(f"Log channel {channel_id} not found; dropping its log messages until it's back (/journal keeps them)")
+            return
+        self.missing_log_channels.discard(channel_id)
+        # One send in flight per channel: while it waits, new entries pile up in the bounded
+        # queue and then are counted and skipped, rather than the outbound queue growing unbounded
+        for embeds in pack_embeds(coalesce_entries(batch)):
+            try:
+                await self.bot.outbound.call(
+                    lambda: channel.send(embeds=embeds),
+                    priority=BACKGROUND, bucket=("channel", channel_id), ttl=LOG_SEND_TTL,
+                    label=f"{len(embeds)} log embed(s) to {channel_id}",
+                )
+            except OutboundDropped:
+                pass  # Counted by the scheduler; /journal still has the events
+            except discord.HTTPException as e:
+                log.error(f"Failed to send {len(embeds)} log embed(s) to {channel_id}: {e}")
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        await self.log_embed(
+            member.guild,
+            "Member Joined",
+            f"{member.mention} joined the server.",
+            discord.Color.green(),
+            user=member
+        )
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        await self.log_embed(
+            member.guild,
+            "Member Left",
+            f"{member.mention} left the server.",
+            discord.Color.red(),
+            user=member
+        )
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild: discord.Guild, user: discord.User):
+        await self.log_embed(
+            guild,
+            "Member Banned",
+            f"{user.mention} was banned.",
+            discord.Color.dark_red(),
+            user=user
+        )
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, user: discord.User):
+        await self.log_embed(
+            guild,
+            "Member Unbanned",
+            f"{user.mention} was unbanned.",
+            discord.Color.green(),
+            user=user
+        )
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, user: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        if before.channel != after.channel:
+            if before.channel is None:
+                info = f"User: {user.mention} ({user.id})\nJoined: {after.channel.mention}"
+                await self.log_embed(user.guild, "Voice Connect", info, discord.Color.green(), user=user, channel_id=after.channel.id)
+            elif after.channel is None:
+                info = f"User: {user.mention} ({user.id})\nLeft: {before.channel.mention}"
+                await self.log_embed(user.guild, "Voice Disconnect", info, discord.Color.red(), user=user, channel_id=before.channel.id)
+            else:
+                info = f"User: {user.mention} ({user.id})\nFrom: {before.channel.mention}\nTo: {after.channel.mention}"
+                await self.log_embed(user.guild, "Voice Moved", info, discord.Color.blurple(), user=user, channel_id=after.channel.id)
+
+    async def cache_message(self, message: discord.Message):
+        self.message_cache.put(
+            message.guild.id, message.id, message.author.id, message.channel.id,
+            message.created_at.timestamp(), message.content
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.message_cache.drop_guild(guild.id)
+
+    async def log_deleted_message(self, guild: discord.Guild, author_id: int, channel_id: int, content: str):
+        await self.log_embed(
+            guild,
+            "Message Deleted",
+            f"**Author:** <@{author_id}>\n**Channel:** <#{channel_id}>\n**Content:** {content}",
+            discord.Color.red(),
+            user=discord.Object(id=author_id),
+            channel_id=channel_id
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.guild_id is None:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        cached = self.message_cache.pop(payload.guild_id, payload.message_id)
+        if guild is None or cached is None:
+            return
+        await self.log_deleted_message(guild, cached.author_id, cached.channel_id, cached.content)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.guild_id is None:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        uncached = 0
+        for message_id in payload.message_ids:
+            cached = self.message_cache.pop(payload.guild_id, message_id)
+            if cached is None:
+                uncached += 1
+                continue
+            await self.log_deleted_message(guild, cached.author_id, cached.channel_id, cached.content)
+        if uncached:
+            await self.log_embed(
+                guild,
+                "Messages Bulk Deleted",
+                f"**Channel:** <#{payload.channel_id}>\n{uncached} message(s) deleted whose content was not cached.",
+                discord.Color.red(),
+                channel_id=payload.channel_id
+            )
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # Embed-only updates (e.g. link previews) arrive without content
+        if payload.guild_id is None or "content" not in payload.data:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        cached = self.message_cache.get(payload.guild_id, payload.message_id)
+        if guild is None or cached is None:
+            return
+        before = cached.content
+        after = payload.data["content"]
+        if before == after:
+            return
+        self.message_cache.put(payload.guild_id, payload.message_id, cached.author_id, cached.channel_id, cached.created_at, after)
+        await self.log_embed(
+            guild,
+            "Message Edited",
+            f"**Author:** <@{cached.author_id}>\n**Channel:** <#{cached.channel_id}>\n**Before:** {before}\n**After:** {after}",
+            discord.Color.orange(),
+            user=discord.Object(id=cached.author_id),
+            channel_id=cached.channel_id
+        )
+
+    @commands.Cog.listener()
+    async def on_member_update(self, old: discord.Member, new: discord.Member):
+        if old.nick != new.nick:
+            info = f"User: {old.mention} ({old.id})\nOld Nick: {old.nick}\nNew Nick: {new.nick}"
+            await self.log_embed(old.guild, "Nickname Changed", info, discord.Color.blue(), user=new)
+
+        if old.roles != new.roles:
+            gained = set(new.roles) - set(old.roles)
+            lost = set(old.roles) - set(new.roles)
+
+            if gained:
+                info = f"User: {new.mention} ({new.id})\nGained: {', '.join(r.mention for r in gained)}"
+                await self.log_embed(new.guild, "Roles Added", info, discord.Color.green(), user=new)
+
+            if lost:
+                info = f"User: {new.mention} ({new.id})\nRemoved: {', '.join(r.mention for r in lost)}"
+                await self.log_embed(new.guild, "Roles Removed", info, discord.Color.red(), user=new)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        await self.log_embed(
+            channel.guild,
+            "Channel Created",
+            f"{channel.mention} was created.",
+            discord.Color.green(),
+            channel_id=channel.id
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        await self.log_embed(
+            channel.guild,
+            "Channel Deleted",
+            f"{channel.name} was deleted.",
+            discord.Color.red(),
+            channel_id=channel.id
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        if before.name != after.name:
+            await self.log_embed(
+                before.guild,
+                "Channel Renamed",
+                f"{before.name} renamed to {after.name}.",
+                discord.Color.blue(),
+                channel_id=after.id
+            )
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(EventTracker(bot))
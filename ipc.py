@@ -0,0 +1,231 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger('discord_bot')
+
+# Seconds between attempts to reach the hub again after losing it, growing per failed attempt
+RECONNECT_BACKOFF = [1, 2, 5, 10, 30]
+
+class IPCServer:
+    """Key/value hub shared by the cluster's worker processes.
+
+    Speaks JSON lines over a local TCP socket. Supports ``get``, ``set``,
+    ``delete``, an atomic ``incr``, ``items`` by key prefix and ``watch``: every
+    change to a key is pushed to the connections watching a matching prefix.
+    The launcher process runs the server; state is saved to ``state_path``.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, state_path: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.state_path = state_path
+        self.state = {}
+        self._watchers = {}  # Maps StreamWriter -> set of watched key prefixes
+        self._connections = set()  # Tasks serving a worker connection
+        self._server = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        # Drop live connections too, so workers notice and reconnect to the next hub
+        for writer in list(self._watchers):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def save(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _changed(self, key: str, value):
+        self.save()
+        event = (json.dumps({"event": "changed", "key": key, "value": value}) + "\n").encode("utf-8")
+        for writer, prefixes in self._watchers.items():
+            if any(key.startswith(prefix) for prefix in prefixes):
+                writer.write(event)
+
+    def _apply(self, writer, request: dict):
+        op = request["op"]
+        key = request.get("key")
+        if op == "get":
+            return self.state.get(key)
+        if op == "set":
+            self.state[key] = request["value"]
+            self._changed(key, request["value"])
+            return True
+        if op == "delete":
+            existed = self.state.pop(key, None) is not None
+            if existed:
+                self._changed(key, None)
+            return existed
+        if op == "incr":
+            # floor lets a worker seed the counter with the value it persisted before clustering
+            value = max(self.state.get(key, 0), request.get("floor", 0)) + 1
+            self.state[key] = value
+            self._changed(key, value)
+            return value
+        if op == "items":
+            prefix = request.get("prefix", "")
+            return {k: v for k, v in self.state.items() if k.startswith(prefix)}
+        if op == "watch":
+            self._watchers[writer].add(request["prefix"])
+            return True
+        raise ValueError(f"Unknown op {op!r}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._watchers[writer] = set()
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                try:
+                    response = {"id": request["id"], "result": self._apply(writer, request)}
+                except Exception as e:
+                    response = {"id": request["id"], "error": str(e)}
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self._watchers[writer]
+            self._connections.discard(task)
+            writer.close()
+
+class IPCClient:
+    """Worker-side connection to the :class:`IPCServer`, available to cogs as ``bot.ipc``.
+
+    If the hub goes away, requests fail with ``ConnectionError`` while the client
+    reconnects with backoff. Once back, it watches its prefixes again and replays
+    their current keys to the callbacks, since changes made in between were never
+    pushed (keys deleted in between are not replayed).
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._ids = itertools.count()
+        self._pending = {}  # Maps request id -> Future
+        self._watches = []  # (prefix, callback(key, value))
+        self._reader_task = None
+        self._resync_task = None
+        self._writer = None
+
+    async def connect(self):
+        reader = await self._open()
+        self._reader_task = asyncio.create_task(self._run(reader))
+
+    async def _open(self) -> asyncio.StreamReader:
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        return reader
+
+    async def close(self):
+        self._reader_task.cancel()
+        if self._resync_task is not None:
+            self._resync_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    def _notify(self, key: str, value):
+        for prefix, callback in self._watches:
+            if key.startswith(prefix):
+                try:
+                    callback(key, value)
+                except Exception as e:
+                    logger.error(f"IPC watch callback for {prefix!r} failed: {e}")
+
+    async def _run(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                await self._read(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            self._writer.close()
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("IPC hub closed the connection"))
+            self._pending.clear()
+            reader = await self._reconnect()
+            self._resync_task = asyncio.create_task(self._resync())
+
+    async def _reconnect(self) -> asyncio.StreamReader:
+        for attempt in itertools.count():
+            delay = RECONNECT_BACKOFF[min(attempt, len(RECONNECT_BACKOFF) - 1)]
+            logger.warning(f"Lost the IPC hub at {self.host}:{self.port}; reconnecting in {delay}s")
+            await asyncio.sleep(delay)
+            try:
+                reader = await self._open()
+            except OSError as e:
+                logger.warning(f"IPC hub still unreachable: {e}")
+                continue
+            logger.info("Reconnected to the IPC hub")
+            return reader
+
+    async def _resync(self):
+        # The new connection has no watches, and nothing changed in between was pushed to us
+        try:
+            for prefix in dict.fromkeys(prefix for prefix, _ in self._watches):
+                await self.request("watch", prefix=prefix)
+                for key, value in (await self.items(prefix)).items():
+                    self._notify(key, value)
+        except ConnectionError:
+            pass  # Lost again; the next reconnect resyncs
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message.get("event") == "changed":
+                self._notify(message["key"], message["value"])
+                continue
+            future = self._pending.pop(message["id"], None)
+            if future is None or future.done():
+                continue
+            if "error" in message:
+                future.set_exception(RuntimeError(message["error"]))
+            else:
+                future.set_result(message["result"])
+
+    async def request(self, op: str, **fields):
+        if self._writer is None:
+            raise ConnectionError("Not connected to the IPC hub")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write((json.dumps({"id": request_id, "op": op, **fields}) + "\n").encode("utf-8"))
+        await self._writer.drain()
+        return await future
+
+    async def get(self, key: str):
+        return await self.request("get", key=key)
+
+    async def set(self, key: str, value):
+        return await self.request("set", key=key, value=value)
+
+    async def delete(self, key: str) -> bool:
+        return await self.request("delete", key=key)
+
+    async def incr(self, key: str, floor: int = 0) -> int:
+        return await self.request("incr", key=key, floor=floor)
+
+    async def items(self, prefix: str = "") -> dict:
+        return await self.request("items", prefix=prefix)
+
+    async def watch(self, prefix: str, callback):
+        """Call ``callback(key, value)`` whenever any process changes a key under ``prefix`` (value None = deleted)."""
+        self._watches.append((prefix, callback))
+        await self.request("watch", prefix=prefix)
@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger('discord_bot')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER,
+    channel_id INTEGER,
+    kind TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_guild_user_ts ON events (guild_id, user_id, ts);
+CREATE INDEX IF NOT EXISTS events_guild_ts ON events (guild_id, ts);
+"""
+
+class EventJournal:
+    """Append-only SQLite journal of logged events.
+
+    ``append()`` only buffers in memory; a background task writes the buffer in
+    batches on a dedicated thread, so the event loop never waits on disk. Rows
+    stay buffered until their batch commits; once ``max_pending`` are waiting,
+    new events are counted in ``dropped`` instead.
+    """
+
+    def __init__(self, path: str, *, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 100_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._conn = None
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self._closing = False
+        self._flush_lock = asyncio.Lock()  # One batch in flight, so rows are never written twice
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # Has to come before anything else touches the file to apply to a new database
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # A journal created without it only converts with one full rewrite
+            logger.info(f"Converting {self.path} to incremental auto-vacuum")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    async def open(self):
+        await self._run(self._open)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._writer:
+            # Let an in-flight batch commit and pop its rows rather than cancel it and write them twice
+            self._closing = True
+            self._wakeup.set()
+            await self._writer
+            self._writer = None
+        try:
+            await self.flush()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(self._pending)} journal event(s) on close: {e}")
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+    def append(self, guild_id: int, kind: str, description: str, user_id: Optional[int] = None, channel_id: Optional[int] = None, ts: Optional[float] = None):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((ts or time.time(), guild_id, user_id, channel_id, kind, description))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _insert(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO events (ts, guild_id, user_id, channel_id, kind, description) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                # Popped only once the batch is committed, so a failed write is retried
+                rows = list(itertools.islice(self._pending, self.batch_size))
+                await self._run(self._insert, rows)
+                for _ in rows:
+                    self._pending.popleft()
+
+    async def _write_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write event journal: {e}")
+
+    def _query(self, guild_id, user_id, since, before_id, limit):
+        sql = "SELECT id, ts, user_id, channel_id, kind, description FROM events WHERE guild_id = ?"
+        params = [guild_id]
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+        if since is not None:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return self._conn.execute(sql, params).fetchall()
+
+    async def query(self, guild_id: int, *, user_id: Optional[int] = None, since: Optional[float] = None, before_id: Optional[int] = None, limit: int = 10):
+        """Newest-first page of events. Pass the last row's id as ``before_id`` for the next page."""
+        return await self._run(self._query, guild_id, user_id, since, before_id, limit)
+
+    def _prune(self, cutoff):
+        with self._conn:
+            deleted = self._conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+        # Frees one page per step; execute() steps it only once, executescript() runs it to the end
+        self._conn.executescript("PRAGMA incremental_vacuum;")
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    async def prune(self, retention_days: float):
+        """Delete events older than ``retention_days`` and give the freed pages back to the OS."""
+        return await self._run(self._prune, time.time() - retention_days * 86400)
+
+async def _benchmark(events: int = 200_000):
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = EventJournal(os.path.join(tmp, "bench.db"))
+        await journal.open()
+        start = time.perf_counter()
+        for i in range(events):
+            journal.append(i % 50, "Member Joined", f"<@{i}> joined the server.", user_id=i, channel_id=1)
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+        append_done = time.perf_counter()
+        await journal.flush()
+        end = time.perf_counter()
+        await journal.close()
+    print(f"append: {events / (append_done - start):,.0f} events/s on the event loop")
+    print(f"ingest: {events / (end - start):,.0f} events/s to disk")
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from ipc import IPCServer, IPCClient
+from ticket_store import read_counter
+
+logger = logging.getLogger('discord_bot')
+
+BOT_SCRIPT = os.path.join(os.path.abspath(os.path.dirname(__file__)), "bot.py")
+# Discord allows one IDENTIFY per 5 seconds per max_concurrency bucket
+IDENTIFY_INTERVAL = 5.0
+RESTART_BACKOFF = (5, 15, 60)
+# Member the --selftest bot workers ban across clusters
+SELFTEST_USER_ID = 4242
+
+def fetch_gateway_info(token: str) -> dict:
+    """Recommended shard count and identify concurrency from ``GET /gateway/bot``."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (launcher, 1.0)"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return {"shards": data["shards"], "max_concurrency": data["session_start_limit"]["max_concurrency"]}
+
+def split_shards(shard_count: int, clusters: int) -> list:
+    """Contiguous shard id ranges, as even as possible: 10 shards over 3 clusters -> [0-3], [4-6], [7-9]."""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def seed_ticket_counter(server: IPCServer, ticket_store: str):
+    """Start the shared counter above every number the single- or multi-process stores handed out."""
+    if "ticket_counter" in server.state:
+        return
+    root, ext = os.path.splitext(ticket_store)
+    counter = 0
+    for path in [ticket_store, *glob.glob(f"{root}.cluster*{ext}")]:
+        counter = max(counter, read_counter(path))
+    server.state["ticket_counter"] = counter
+    server.save()
+
+async def run_cluster(cluster_id: int, clusters: int, shard_ids: list, shard_count: int, ipc_port: int, delay: float, command: list):
+    """Run one worker process for ``shard_ids``, restarting it with backoff if it crashes."""
+    await asyncio.sleep(delay)
+    env = {
+        **os.environ,
+        "BOT_CLUSTER_ID": str(cluster_id),
+        "BOT_CLUSTER_COUNT": str(clusters),
+        "BOT_SHARD_IDS": ",".join(map(str, shard_ids)),
+        "BOT_SHARD_COUNT": str(shard_count),
+        "BOT_IPC_PORT": str(ipc_port),
+    }
+    failures = 0
+    while True:
+        logger.info(f"Starting cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(*command, env=env)
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+        if code == 0:
+            logger.info(f"Cluster {cluster_id} exited cleanly")
+            return code
+        # A worker that stayed up a while gets a fresh backoff sequence
+        failures = 0 if time.monotonic() - started > 300 else failures + 1
+        backoff = RESTART_BACKOFF[min(failures, len(RESTART_BACKOFF) - 1)]
+        logger.error(f"Cluster {cluster_id} exited with code {code}; restarting in {backoff}s")
+        await asyncio.sleep(backoff)
+
+async def launch(server: IPCServer, command: list, shard_count: int, max_concurrency: int, clusters: int):
+    """Start the IPC hub and one worker per shard range; returns the workers' exit codes."""
+    await server.start()
+    ranges = split_shards(shard_count, clusters)
+    logger.info(f"IPC hub on port {server.port}; {shard_count} shards over {len(ranges)} clusters")
+    # Stagger clusters so their shards don't IDENTIFY in the same rate limit window
+    delays = []
+    elapsed = 0.0
+    for shard_ids in ranges:
+        delays.append(elapsed)
+        elapsed += len(shard_ids) / max_concurrency * IDENTIFY_INTERVAL
+    try:
+        return await asyncio.gather(*(
+            run_cluster(i, len(ranges), shard_ids, shard_count, server.port, delay, command)
+            for i, (shard_ids, delay) in enumerate(zip(ranges, delays))
+        ))
+    finally:
+        await server.close()
+
+async def fake_worker():
+    """Stands in for a gateway-connected bot.py in ``--selftest``: exercises the shared counter, watches and stats."""
+    cluster_id = os.environ["BOT_CLUSTER_ID"]
+    shard_ids = [int(i) for i in os.environ["BOT_SHARD_IDS"].split(",")]
+    clusters = int(os.environ["SELFTEST_CLUSTERS"])
+    tickets = int(os.environ["SELFTEST_TICKETS"])
+    client = IPCClient("127.0.0.1", int(os.environ["BOT_IPC_PORT"]))
+    await client.connect()
+    seen = set()
+    all_seen = asyncio.Event()
+
+    def on_ghosting(key, value):
+        seen.add(key)
+        if len(seen) == clusters:
+            all_seen.set()
+
+    await client.watch("ghosting:", on_ghosting)
+    for key, value in (await client.items("ghosting:")).items():
+        on_ghosting(key, value)
+    await client.set(f"ghosting:{cluster_id}", {"name": f"cluster {cluster_id}", "avatar_url": None})
+    numbers = await asyncio.gather(*(client.incr("ticket_counter") for _ in range(tickets)))
+    await client.set(f"stats:{cluster_id}", {"shards": [(shard_id, 0, 0) for shard_id in shard_ids], "numbers": numbers})
+    await asyncio.wait_for(all_seen.wait(), timeout=10)
+    await client.close()
+
+async def selftest(clusters: int, shard_count: int, tickets: int) -> bool:
+    """Run the launcher against fake workers and check shard coverage, counter uniqueness and watch fan-out."""
+    os.environ["SELFTEST_CLUSTERS"] = str(min(clusters, shard_count))
+    os.environ["SELFTEST_TICKETS"] = str(tickets)
+    server = IPCServer()
+    start = time.perf_counter()
+    command = [sys.executable, os.path.abspath(__file__), "--fake-worker"]
+    codes = await asyncio.wait_for(launch(server, command, shard_count, shard_count, clusters), timeout=60)
+    elapsed = time.perf_counter() - start
+    stats = [value for key, value in server.state.items() if key.startswith("stats:")]
+    shards = sorted(shard for cluster in stats for shard, _, _ in cluster["shards"])
+    numbers = sorted(n for cluster in stats for n in cluster["numbers"])
+    expected_numbers = list(range(1, len(stats) * tickets + 1))
+    ok = all(code == 0 for code in codes) and shards == list(range(shard_count)) and numbers == expected_numbers
+    print(f"{len(stats)} clusters, {shard_count} shards, {len(numbers)} ticket numbers in {elapsed:.2f}s: {'ok' if ok else 'FAILED'}")
+    return ok
+
+def selftest_guild_id(shard_id: int, shard_count: int) -> int:
+    # Smallest non-zero snowflake Discord's shard formula puts on ``shard_id``
+    return (shard_id + shard_count) << 22
+
+async def wait_for_keys(client: IPCClient, prefix: str, count: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while len(items := await client.items(prefix)) < count:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"only {len(items)}/{count} {prefix!r} keys after {timeout}s")
+        await asyncio.sleep(0.05)
+    return items
+
+async def bot_worker():
+    """A real bot.py process in ``--selftest``, minus the gateway: hands off its scheduled jobs and relays a ban.
+
+    REST is replaced by a recorder of the bans the relay would have sent; everything
+    else is bot.py's and moderation.py's own code talking to the launcher's hub.
+    """
+    import discord
+    import bot as worker  # Reads its cluster from the BOT_* environment, like a normal start
+    from moderation import Moderation, build_action
+
+    cluster_id = int(worker.CLUSTER_ID)
+    client = worker.bot
+    await client._async_setup_hook()  # What login() sets up before connecting
+    client.ipc = IPCClient("127.0.0.1", int(worker.IPC_PORT))
+    await client.ipc.connect()
+    await worker.hand_off_scheduled_jobs()
+
+    guild_ids = [selftest_guild_id(shard_ids[0], worker.SHARD_COUNT) for shard_ids in split_shards(worker.SHARD_COUNT, worker.CLUSTER_COUNT)]
+    banned = []
+
+    async def record_ban(user_id, guild_id, delete_message_seconds=86400, reason=None):
+        banned.append([int(guild_id), int(user_id)])
+
+    client.http.ban = record_ban
+    guild = discord.Guild(data={
+        "id": str(guild_ids[cluster_id]), "name": f"selftest-{cluster_id}", "member_count": 1,
+        "channels": [], "emojis": [], "stickers": [], "features": [],
+        "roles": [{"id": str(guild_ids[cluster_id]), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "members": [{"user": {"id": str(SELFTEST_USER_ID), "username": "target", "discriminator": "0", "avatar": None},
+                     "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}],
+    }, state=client._connection)
+    client._connection._add_guild(guild)
+    cog = Moderation(client)
+    await cog.cog_load()
+    cog.shared_guilds.add_guild(guild)
+    await client.ipc.set(f"botcheck-ready:{cluster_id}", True)
+    await wait_for_keys(client.ipc, "botcheck-ready:", worker.CLUSTER_COUNT)
+
+    report = {"owns": [worker.owns_guild(guild_id) for guild_id in guild_ids]}
+    if cluster_id == 0:
+        action = build_action("ban", "selftest")
+        results = await cog.run_fan_out(SELFTEST_USER_ID, action)
+        remote, unanswered = await cog.run_remote("ban", SELFTEST_USER_ID, "selftest")
+        report["relay"] = {"results": sorted(results + remote), "unanswered": unanswered}
+        await client.ipc.set("botcheck-done", True)
+    else:
+        await wait_for_keys(client.ipc, "botcheck-done", 1)
+    report["jobs"] = sorted(job.id for job in client.scheduler.pending())
+    report["banned"] = banned
+    await client.ipc.set(f"botcheck:{cluster_id}", report)
+    await cog.cog_unload()
+    await client.ipc.close()
+
+async def bot_selftest(clusters: int, shard_count: int) -> bool:
+    """Run real bot-side handlers in every cluster against the hub: owns_guild, job hand-off and the ban relay."""
+    ranges = split_shards(shard_count, clusters)
+    guild_ids = [selftest_guild_id(shard_ids[0], shard_count) for shard_ids in ranges]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "config.json"), 'w', encoding='utf-8') as f:
+            json.dump({"cogs": ["moderation"]}, f)
+        # Each cluster starts out holding a job for the next cluster's guild, as after a shard layout change
+        for i in range(len(ranges)):
+            job = {"id": f"job-{i}", "kind": "temprole", "due": time.time() + 3600,
+                   "data": {"guild_id": guild_ids[(i + 1) % len(ranges)], "member_id": SELFTEST_USER_ID, "role_id": 1}}
+            with open(os.path.join(tmp, f"scheduled_jobs.cluster{i}.json"), 'w', encoding='utf-8') as f:
+                json.dump([job], f)
+        server = IPCServer()
+        command = [sys.executable, os.path.abspath(__file__), "--bot-worker"]
+        os.chdir(tmp)
+        try:
+            codes = await asyncio.wait_for(launch(server, command, shard_count, shard_count, clusters), timeout=60)
+        finally:
+            os.chdir(cwd)
+    reports = {int(key.split(":")[1]): value for key, value in server.state.items() if key.startswith("botcheck:")}
+    problems = []
+    if any(code != 0 for code in codes) or sorted(reports) != list(range(len(ranges))):
+        problems.append(f"exit codes {codes}, reports from clusters {sorted(reports)}")
+    for i, report in reports.items():
+        if report["owns"] != [j == i for j in range(len(ranges))]:
+            problems.append(f"cluster {i} owns_guild {report['owns']}")
+        if report["jobs"] != [f"job-{(i - 1) % len(ranges)}"]:
+            problems.append(f"cluster {i} holds jobs {report['jobs']}")
+        if report["banned"] != [[guild_ids[i], SELFTEST_USER_ID]]:
+            problems.append(f"cluster {i} banned {report['banned']}")
+    relay = reports.get(0, {}).get("relay")
+    expected = [[f"selftest-{i}", None] for i in range(len(ranges))]
+    if relay is None or relay["results"] != expected or relay["unanswered"]:
+        problems.append(f"relay returned {relay}")
+    print(f"{len(ranges)} bot workers: owns_guild, job hand-off and ban relay: {'ok' if not problems else 'FAILED'}")
+    for problem in problems:
+        print(f"  {problem}")
+    return not problems
+
+async def ipc_reconnect_selftest() -> bool:
+    """Restart the hub under a watching client and check it reconnects, re-watches and catches up."""
+    server = IPCServer()
+    await server.start()
+    port = server.port
+    seen = {}
+    client = IPCClient("127.0.0.1", port)
+    await client.connect()
+    await client.watch("job:", lambda key, value: seen.__setitem__(key, value))
+    await server.close()
+    # Set while the client is cut off, so only the resync can deliver it
+    server.state["job:missed"] = 1
+    restarted = IPCServer(port=port)
+    restarted.state = server.state
+    await restarted.start()
+    start = time.perf_counter()
+    try:
+        while "job:missed" not in seen:
+            if time.perf_counter() - start > 10:
+                break
+            await asyncio.sleep(0.05)
+        other = IPCClient("127.0.0.1", port)
+        await other.connect()
+        await other.set("job:pushed", 2)
+        await asyncio.sleep(0.2)
+        await other.close()
+    finally:
+        await client.close()
+        await restarted.close()
+    ok = seen == {"job:missed": 1, "job:pushed": 2}
+    print(f"IPC client reconnected after a hub restart in {time.perf_counter() - start:.1f}s: {'ok' if ok else f'FAILED ({seen})'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several processes, each with a range of shards.")
+    parser.add_argument("--clusters", type=int, help="worker processes (default: sharding.clusters in config.json)")
+    parser.add_argument("--shards", type=int, help="total shards (default: sharding.shard_count, else Discord's recommendation)")
+    parser.add_argument("--selftest", action="store_true", help="run against local fake workers instead of Discord")
+    parser.add_argument("--fake-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--bot-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.fake_worker:
+        asyncio.run(fake_worker())
+        return
+    if args.bot_worker:
+        asyncio.run(bot_worker())
+        return
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.selftest:
+        ok = asyncio.run(selftest(args.clusters or 3, args.shards or 10, 200))
+        ok = asyncio.run(bot_selftest(args.clusters or 3, args.shards or 10)) and ok
+        ok = asyncio.run(ipc_reconnect_selftest()) and ok
+        sys.exit(0 if ok else 1)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    with open('config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sharding = config.get("sharding", {})
+    shard_count = args.shards or sharding.get("shard_count")
+    max_concurrency = 1
+    if not shard_count:
+        info = fetch_gateway_info(os.getenv('DISCORD_BOT_TOKEN'))
+        shard_count, max_concurrency = info["shards"], info["max_concurrency"]
+    clusters = args.clusters or sharding.get("clusters", 1)
+    server = IPCServer(port=sharding.get("ipc_port", 0), state_path=sharding.get("ipc_state", "ipc_state.json"))
+    seed_ticket_counter(server, config.get("ticket_store", "tickets.db"))
+    try:
+        asyncio.run(launch(server, [sys.executable, BOT_SCRIPT], shard_count, max_concurrency, clusters))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
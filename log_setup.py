@@ -0,0 +1,121 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record with its message merged; the rest of formatting happens on the listener thread.
+
+    ``%`` args are merged here because they may be mutable objects the caller
+    changes before the listener gets to the record.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Keep only every ``rate``-th DEBUG record per call site; other levels always pass.
+
+    Keyed by file and line rather than message, so f-string messages share one
+    counter and the table stays as small as the number of debug log calls.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._counts = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.rate == 0
+
+def setup_logging(config: dict) -> logging.handlers.QueueListener:
+    """Route all logging through a queue so the event loop never waits on disk or stderr.
+
+    Callers only build a record and enqueue it; a background thread formats and
+    writes to a rotating file (by size, or by time when ``rotate_when`` is set)
+    and to stderr. ``config`` is the ``logging`` section of config.json.
+    """
+    formatter = JsonFormatter() if config.get("json") else logging.Formatter(FORMAT)
+    path = config.get("file", "bot.log")
+    if config.get("rotate_when"):
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=config["rotate_when"], backupCount=config.get("backup_count", 5), encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config.get("max_bytes", 10 * 1024 * 1024), backupCount=config.get("backup_count", 5), encoding='utf-8'
+        )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    # Thread/process names aren't in FORMAT, so don't pay to look them up for every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config.get("debug_sample_rate", 100)))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(config.get("level", "INFO"))
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def _benchmark(calls: int = 200_000):
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        listener = setup_logging({"file": os.path.join(tmp, "bench.log"), "level": "DEBUG"})
+        logging.getLogger().handlers[0].setLevel(logging.DEBUG)
+        listener.handlers = listener.handlers[:1]  # Don't flood the terminal
+        atexit.unregister(listener.stop)
+        baseline = logging.getLogger('bench.baseline')
+        baseline.addHandler(logging.NullHandler())
+        baseline.propagate = False
+        start = time.perf_counter()
+        for i in range(calls):
+            baseline.info("Processing message %s from %s", i, "someone")
+        print(f"baseline (NullHandler): {(time.perf_counter() - start) / calls * 1e6:.2f}us per call")
+        logger = logging.getLogger('discord_bot')
+        for level, label in ((logging.INFO, "info"), (logging.DEBUG, "sampled debug")):
+            start = time.perf_counter()
+            for i in range(calls):
+                logger.log(level, "Processing message %s from %s", i, "someone")
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {elapsed / calls * 1e6:.2f}us per call on the calling thread")
+        listener.stop()
+
+if __name__ == "__main__":
+    _benchmark()
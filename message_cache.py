@@ -0,0 +1,97 @@
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+# Content shorter than this is stored as-is; zlib's header would outweigh the saving
+COMPRESS_MIN_BYTES = 64
+# Rough per-entry cost of the slots object and dict entry, counted against the budget
+ENTRY_OVERHEAD_BYTES = 120
+
+class CachedMessage:
+    __slots__ = ("message_id", "author_id", "channel_id", "created_at", "stored_at", "_blob", "_compressed")
+
+    def __init__(self, message_id: int, author_id: int, channel_id: int, created_at: float, content: str):
+        self.message_id = message_id
+        self.author_id = author_id
+        self.channel_id = channel_id
+        self.created_at = created_at
+        self.stored_at = time.monotonic()
+        raw = content.encode("utf-8")
+        self._compressed = len(raw) >= COMPRESS_MIN_BYTES
+        self._blob = zlib.compress(raw) if self._compressed else raw
+
+    @property
+    def content(self) -> str:
+        raw = zlib.decompress(self._blob) if self._compressed else self._blob
+        return raw.decode("utf-8")
+
+    @property
+    def size(self) -> int:
+        return len(self._blob) + ENTRY_OVERHEAD_BYTES
+
+class MessageContentCache:
+    """Compact per-guild cache of message content for delete/edit logging.
+
+    Holds only author id, channel id, timestamp and (compressed) content, so far
+    more history fits in memory than with full ``discord.Message`` objects. Each
+    guild has its own byte budget; the least recently used entries are evicted
+    first, and entries older than ``ttl`` seconds are dropped.
+    """
+
+    def __init__(self, guild_budget_bytes: int = 2_000_000, ttl: float = 7 * 86400):
+        self.guild_budget_bytes = guild_budget_bytes
+        self.ttl = ttl
+        self._guilds = {}  # Maps guild id -> OrderedDict of message id -> CachedMessage
+        self._bytes = {}  # Maps guild id -> bytes used by that guild's entries
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._guilds.values())
+
+    def bytes_used(self, guild_id: Optional[int] = None) -> int:
+        if guild_id is not None:
+            return self._bytes.get(guild_id, 0)
+        return sum(self._bytes.values())
+
+    def put(self, guild_id: int, message_id: int, author_id: int, channel_id: int, created_at: float, content: str):
+        entries = self._guilds.setdefault(guild_id, OrderedDict())
+        self.pop(guild_id, message_id)
+        entry = CachedMessage(message_id, author_id, channel_id, created_at, content)
+        entries[message_id] = entry
+        self._bytes[guild_id] = self._bytes.get(guild_id, 0) + entry.size
+        self._evict(guild_id, entries)
+
+    def get(self, guild_id: int, message_id: int) -> Optional[CachedMessage]:
+        entries = self._guilds.get(guild_id)
+        if not entries:
+            return None
+        entry = entries.get(message_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl:
+            self.pop(guild_id, message_id)
+            return None
+        entries.move_to_end(message_id)
+        return entry
+
+    def pop(self, guild_id: int, message_id: int) -> Optional[CachedMessage]:
+        entries = self._guilds.get(guild_id)
+        if not entries:
+            return None
+        entry = entries.pop(message_id, None)
+        if entry is not None:
+            self._bytes[guild_id] -= entry.size
+        return entry
+
+    def drop_guild(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+        self._bytes.pop(guild_id, None)
+
+    def _evict(self, guild_id: int, entries: OrderedDict):
+        cutoff = time.monotonic() - self.ttl
+        while entries:
+            oldest = next(iter(entries.values()))
+            if self._bytes[guild_id] <= self.guild_budget_bytes and oldest.stored_at >= cutoff:
+                break
+            entries.popitem(last=False)
+            self._bytes[guild_id] -= oldest.size
@@ -0,0 +1,407 @@
+import asyncio
+import functools
+import logging
+import time
+from outbound import PRIORITY_NAMES
+
+logger = logging.getLogger('discord_bot')
+
+# Histogram buckets are powers of two nanoseconds, 2**10 (~1us) to 2**34 (~17s), so
+# finding the bucket is an int.bit_length() instead of a search
+MIN_BUCKET_BITS = 10
+MAX_BUCKET_BITS = 34
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # Maps label values tuple -> count
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class HistogramChild:
+    """One label combination of a :class:`Histogram`; hold on to it in hot paths to skip the label lookup."""
+
+    __slots__ = ("counts", "sum_ns")
+
+    def __init__(self):
+        # counts[k] holds observations with 2**(k-1) <= ns < 2**k; folded into the exported buckets at render time
+        self.counts = [0] * 65
+        self.sum_ns = 0
+
+    def observe_ns(self, ns: int):
+        self.counts[ns.bit_length()] += 1
+        self.sum_ns += ns
+
+    def observe(self, seconds: float):
+        self.observe_ns(int(seconds * 1e9))
+
+class Histogram:
+    """Durations per label combination; rendered in seconds."""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(2 ** bits / 1e9 for bits in range(MIN_BUCKET_BITS, MAX_BUCKET_BITS + 1))
+        self.children = {}  # Maps label values tuple -> HistogramChild
+
+    def labels(self, *labels) -> HistogramChild:
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children[labels] = HistogramChild()
+        return child
+
+    def observe(self, value: float, *labels):
+        self.labels(*labels).observe(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, child in self.children.items():
+            counts = child.counts
+            cumulative = sum(counts[:MIN_BUCKET_BITS])
+            for bound, count in zip((*self.buckets, "+Inf"), (*counts[MIN_BUCKET_BITS:MAX_BUCKET_BITS + 1], sum(counts[MAX_BUCKET_BITS + 1:]))):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {child.sum_ns / 1e9}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Recording is a few integer operations on the event loop. Values
+    that are already counted elsewhere (e.g. pipeline stage counters) are read
+    by ``collectors`` at scrape time instead of being recorded twice.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []  # Callables run at scrape time; may update metrics before rendering
+
+    def _get(self, cls, name, help, labelnames):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labelnames)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames=()) -> Histogram:
+        return self._get(Histogram, name, help, labelnames)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {collector!r} failed: {e}")
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves ``GET /metrics`` from the registry on a local port."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass  # Headers are not needed
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def sample_loop_lag(registry: MetricsRegistry, interval: float = 0.5):
+    """Record how late the event loop wakes a sleeping task; anything above a few ms means blocking work."""
+    histogram = registry.histogram("bot_event_loop_lag_seconds", "Delay between a scheduled wake-up and when it ran").labels()
+    gauge = registry.gauge("bot_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        histogram.observe(lag)
+        gauge.set(value=lag)
+
+def timed_listener(func, histogram: HistogramChild, errors: Counter, labels: tuple):
+    @functools.wraps(func)
+    async def listener(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            errors.inc(*labels)
+            raise
+        finally:
+            histogram.observe_ns(time.perf_counter_ns() - start)
+
+    listener.timed = True
+    return listener
+
+def instrument_listeners(bot, registry: MetricsRegistry):
+    """Time every loaded Cog listener. Call after the cogs are loaded."""
+    histogram = registry.histogram("bot_listener_duration_seconds", "Cog listener run time", ("cog", "event"))
+    errors = registry.counter("bot_listener_errors_total", "Cog listeners that raised", ("cog", "event"))
+    for cog_name, cog in bot.cogs.items():
+        for event, method in cog.get_listeners():
+            if getattr(method, "timed", False):
+                continue
+            labels = (cog_name, event)
+            wrapped = timed_listener(method, histogram.labels(*labels), errors, labels)
+            bot.remove_listener(method, event)
+            # Unloading a cog looks its listeners up by attribute name, so it removes the wrapper
+            setattr(cog, method.__name__, wrapped)
+            bot.add_listener(wrapped, event)
+
+def instrument_commands(bot, registry: MetricsRegistry):
+    """Time app commands and prefix commands through discord.py's public hooks."""
+    app_histogram = registry.histogram("bot_app_command_duration_seconds", "Slash command run time", ("command", "outcome"))
+    prefix_histogram = registry.histogram("bot_prefix_command_duration_seconds", "Prefix command run time", ("command", "outcome"))
+    tree = bot.tree
+    original_check = tree.interaction_check
+    original_on_error = tree.on_error
+
+    async def interaction_check(interaction):
+        interaction.extras["metrics_start"] = time.perf_counter()
+        return await original_check(interaction)
+
+    def observe_app_command(interaction, command, outcome):
+        start = interaction.extras.get("metrics_start")
+        if start is not None and command is not None:
+            app_histogram.observe(time.perf_counter() - start, command.qualified_name, outcome)
+
+    async def on_error(interaction, error):
+        observe_app_command(interaction, interaction.command, "error")
+        await original_on_error(interaction, error)
+
+    async def on_app_command_completion(interaction, command):
+        observe_app_command(interaction, command, "ok")
+
+    async def before_invoke(ctx):
+        ctx.metrics_start = time.perf_counter()
+
+    async def after_invoke(ctx):
+        outcome = "error" if ctx.command_failed else "ok"
+        prefix_histogram.observe(time.perf_counter() - ctx.metrics_start, ctx.command.qualified_name, outcome)
+
+    tree.interaction_check = interaction_check
+    tree.on_error = on_error
+    bot.add_listener(on_app_command_completion, "on_app_command_completion")
+    bot.before_invoke(before_invoke)
+    bot.after_invoke(after_invoke)
+
+def instrument_http(bot, registry: MetricsRegistry):
+    """Count and time REST calls per route, and count rate limit hits reported by discord.py."""
+    histogram = registry.histogram("bot_rest_request_duration_seconds", "Discord REST call time", ("method", "route", "status"))
+    rate_limits = registry.counter("bot_rest_rate_limited_total", "429 responses and pre-emptive bucket waits")
+    http = bot.http
+    original_request = http.request
+
+    async def request(route, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await original_request(route, **kwargs)
+        except Exception as e:
+            status = str(getattr(e, "status", "error"))
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, route.method, route.path, status)
+
+    class RateLimitCounter(logging.Filter):
+        def filter(self, record):
+            if "rate limit" in str(record.msg).lower():
+                rate_limits.inc()
+            return True
+
+    http.request = request
+    logging.getLogger("discord.http").addFilter(RateLimitCounter())
+
+def pipeline_collector(pipeline, registry: MetricsRegistry):
+    """Export the message pipeline's own counters and stage histograms at scrape time.
+
+    The pipeline keeps log2 buckets per stage itself, so metrics add nothing to the message path.
+    """
+    durations = registry.histogram("bot_pipeline_stage_duration_seconds", "Message stage handler run time", ("stage",))
+    messages = registry.counter("bot_messages_total", "Messages dispatched through the pipeline")
+    duplicates = registry.counter("bot_messages_duplicate_total", "Redelivered messages dropped")
+    checked = registry.counter("bot_pipeline_stage_checked_total", "Messages a stage predicate looked at", ("stage",))
+    matched = registry.counter("bot_pipeline_stage_matched_total", "Messages a stage handled", ("stage",))
+    errors = registry.counter("bot_pipeline_stage_errors_total", "Stage predicates or handlers that raised", ("stage",))
+
+    def collect():
+        messages.values[()] = pipeline.messages
+        duplicates.values[()] = pipeline.seen.hits
+        for stage in pipeline.stages:
+            child = durations.labels(stage.name)
+            child.counts = stage.buckets
+            child.sum_ns = stage.handler_ns
+            checked.values[(stage.name,)] = stage.checked
+            matched.values[(stage.name,)] = stage.matched
+            errors.values[(stage.name,)] = stage.errors
+
+    return collect
+
+def outbound_collector(outbound, registry: MetricsRegistry):
+    """Export the outbound scheduler's queue depth, drops and wait histograms at scrape time."""
+    depth = registry.gauge("bot_outbound_queue_depth", "Outbound requests waiting to be sent", ("priority",))
+    in_flight = registry.gauge("bot_outbound_in_flight", "Outbound requests currently running")
+    submitted = registry.counter("bot_outbound_submitted_total", "Outbound requests queued", ("priority",))
+    dropped = registry.counter("bot_outbound_dropped_total", "Outbound requests dropped past their deadline", ("priority",))
+    failed = registry.counter("bot_outbound_failed_total", "Outbound requests that raised", ("priority",))
+    waits = registry.histogram("bot_outbound_wait_seconds", "Time outbound requests spent queued", ("priority",))
+
+    def collect():
+        in_flight.values[()] = len(outbound._in_flight)
+        for priority, name in enumerate(PRIORITY_NAMES):
+            depth.values[(name,)] = outbound.depth[priority]
+            submitted.values[(name,)] = outbound.submitted[priority]
+            dropped.values[(name,)] = outbound.dropped[priority]
+            failed.values[(name,)] = outbound.failed[priority]
+            child = waits.labels(name)
+            child.counts = outbound.wait_buckets[priority]
+            child.sum_ns = outbound.wait_ns[priority]
+
+    return collect
+
+def event_tracker_collector(tracker, registry: MetricsRegistry):
+    """Export the event journal's write backlog and the journal and log channel entries dropped."""
+    pending = registry.gauge("bot_journal_pending", "Journal events waiting to be written")
+    dropped = registry.counter("bot_journal_dropped_total", "Journal events dropped because the write backlog was full")
+    log_dropped = registry.counter("bot_log_entries_dropped_total", "Log channel entries skipped because the channel was backed up")
+
+    def collect():
+        pending.values[()] = len(tracker.journal._pending)
+        dropped.values[()] = tracker.journal.dropped
+        log_dropped.values[()] = tracker.log_dropped_total
+
+    return collect
+
+def _benchmark(messages: int = 100_000):
+    import random
+    import timeit
+    from message_cache import MessageContentCache
+    from pipeline import MessagePipeline
+
+    class FakeBot:
+        async def process_commands(self, message):
+            pass
+
+    class Author:
+        bot = False
+        id = 42
+
+    class Message:
+        __slots__ = ("id", "author", "channel", "guild", "content", "created_at")
+
+    class Channel:
+        id = 7
+
+    class Guild:
+        id = 1
+
+    words = ["hello", "is", "anyone", "here", "the", "server", "patch", "notes", "look", "great"]
+    rng = random.Random(1)
+    batch = []
+    for i in range(messages):
+        message = Message()
+        message.id, message.author, message.channel, message.guild = i, Author, Channel, Guild
+        message.content = " ".join(rng.choices(words, k=rng.randint(3, 30)))
+        message.created_at = time.time()
+        batch.append(message)
+
+    async def run():
+        pipeline = MessagePipeline(FakeBot())
+        cache = MessageContentCache()
+
+        async def cache_stage(message):
+            cache.put(message.guild.id, message.id, message.author.id, message.channel.id, message.created_at, message.content)
+
+        async def mimic(message):
+            pass
+
+        pipeline.register("logging.cache", lambda m: m.guild is not None, cache_stage)
+        pipeline.register("troll.ghost", lambda m: m.author.id in {}, mimic)
+        pipeline.register("troll.mimic", lambda m: len(m.content) > 5 and "?" not in m.content, mimic)
+        start = time.perf_counter()
+        for message in batch:
+            await pipeline.dispatch(message)
+        return time.perf_counter() - start, pipeline
+
+    per_message, pipeline = min((asyncio.run(run()) for _ in range(5)), key=lambda result: result[0])
+    per_message /= messages
+    # What the pipeline does for metrics per matched stage, on top of the timing it already kept
+    per_stage = min(timeit.repeat(
+        "buckets[elapsed.bit_length()] += 1", globals={"buckets": [0] * 65, "elapsed": 12_345}, number=1_000_000, repeat=5
+    )) / 1_000_000
+    matched = sum(1 for stage in pipeline.stages if stage.matched)
+    print(f"message path: {per_message * 1e6:.2f}us per message, {matched} stage(s) matching")
+    print(f"histogram update: {per_stage * 1e9:.0f}ns per matched stage = {matched * per_stage / per_message * 100:.2f}% of the message path")
+    registry = MetricsRegistry()
+    registry.collectors.append(pipeline_collector(pipeline, registry))
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"scrape: {(time.perf_counter() - start) * 1000:.2f}ms for {len(text.splitlines())} lines")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -1,76 +1,383 @@
+import asyncio
+import logging
+import time
+import uuid
 from typing import Optional
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+from outbound import MODERATION
+
+logger = logging.getLogger('discord_bot')
+
+# Cross-guild actions run concurrently, but never more than this many REST calls at once.
+# Each guild has its own ban/kick/member-edit bucket, so this mostly guards the global limit.
+FANOUT_CONCURRENCY = 5
+# Minimum seconds between progress edits on the deferred response
+PROGRESS_EDIT_INTERVAL = 1.0
+# How long to wait for the other cluster processes to report their part of a cross-server action
+REMOTE_FANOUT_TIMEOUT = 60.0
+ACTION_VERBS = {"nickname": "Changed nickname of", "ban": "Banned", "kick": "Kicked"}
+
+class ActionRefused(Exception):
+    """Raised by a fan-out action when the bot can't act in a guild."""
+
+def build_action(kind: str, value: Optional[str]):
+    """``action(guild, target)`` for a cross-server command; ``value`` is the new nickname or the reason.
+
+    ``target`` is the cached Member, or a ``discord.Object`` when the member cache
+    doesn't hold them. Built from plain values so other cluster processes can run
+    the same action.
+    """
+    if kind == "nickname":
+        async def action(guild, target):
+            if not isinstance(target, discord.Member):
+                # The role check needs the member itself
+                target = await guild.fetch_member(target.id)
+            bot_member = guild.me
+            if not bot_member.guild_permissions.manage_nicknames:
+                raise ActionRefused("Missing Manage Nicknames")
+            if target.top_role >= bot_member.top_role:
+                raise ActionRefused("Member's top role is above mine")
+            await target.edit(nick=value)
+    elif kind == "ban":
+        async def action(guild, target):
+            await guild.ban(target, reason=value)
+    elif kind == "kick":
+        async def action(guild, target):
+            await guild.kick(target, reason=value)
+    else:
+        raise ValueError(f"Unknown action {kind!r}")
+    return action
+
+class SharedGuildIndex:
+    """Reverse index of user id -> ids of the guilds the bot shares with that user.
+
+    Lets cross-guild commands visit only the guilds a user is actually in instead
+    of every guild the bot is in. Available to other cogs as ``bot.shared_guilds``.
+    Guilds whose members aren't all cached are filled in from a one-off
+    ``chunk(cache=False)`` and kept current by join and leave events. discord.py has no event for
+    member chunks, so code that calls ``guild.chunk()`` passes the result to
+    ``add_members()``.
+    """
+
+    def __init__(self):
+        self._guilds_by_user = {}
+
+    def __len__(self):
+        return len(self._guilds_by_user)
+
+    def add(self, user_id: int, guild_id: int):
+        self._guilds_by_user.setdefault(user_id, set()).add(guild_id)
+
+    def discard(self, user_id: int, guild_id: int):
+        guild_ids = self._guilds_by_user.get(user_id)
+        if guild_ids is None:
+            return
+        guild_ids.discard(guild_id)
+        if not guild_ids:
+            del self._guilds_by_user[user_id]
+
+    def add_members(self, guild_id: int, members):
+        for member in members:
+            self.add(member.id, guild_id)
+
+    def add_guild(self, guild: discord.Guild):
+        self.add_members(guild.id, guild.members)
+
+    def remove_guild(self, guild_id: int):
+        # Walks every user, but the bot leaving a guild is rare
+        for user_id in list(self._guilds_by_user):
+            self.discard(user_id, guild_id)
+
+    def rebuild(self, guilds):
+        # Guilds whose members aren't all cached keep what was learned about them outside the cache
+        partial = {guild.id for guild in guilds if not guild.chunked}
+        previous, self._guilds_by_user = self._guilds_by_user, {}
+        for user_id, guild_ids in previous.items():
+            kept = guild_ids & partial
+            if kept:
+                self._guilds_by_user[user_id] = kept
+        for guild in guilds:
+            self.add_guild(guild)
+
+    def guilds_for(self, user_id: int) -> frozenset:
+        return frozenset(self._guilds_by_user.get(user_id, ()))
+
+    def check_consistency(self, guilds):
+        """Compare the index against the live member cache.
+
+        Returns ``(missing, stale)`` lists of ``(user_id, guild_id)`` pairs: entries the
+        cache has but the index lacks, and entries the index has but the cache lacks.
+        Guilds whose members aren't all cached (``guild.chunked`` is false) are skipped.
+        """
+        live = {}
+        chunked_ids = set()
+        for guild in guilds:
+            if not guild.chunked:
+                continue
+            chunked_ids.add(guild.id)
+            for member in guild.members:
+                live.setdefault(member.id, set()).add(guild.id)
+        missing = [
+            (user_id, guild_id)
+            for user_id, guild_ids in live.items()
+            for guild_id in guild_ids - self._guilds_by_user.get(user_id, set())
+        ]
+        stale = [
+            (user_id, guild_id)
+            for user_id, guild_ids in self._guilds_by_user.items()
+            for guild_id in (guild_ids & chunked_ids) - live.get(user_id, set())
+        ]
+        return missing, stale
 
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        print("Moderation cog loaded!")
+        self.fanout_limit = asyncio.Semaphore(FANOUT_CONCURRENCY)
+        if not hasattr(bot, "shared_guilds"):
+            bot.shared_guilds = SharedGuildIndex()
+        self.shared_guilds = bot.shared_guilds
+        self.remote_requests = {}  # Maps request id -> (Future, {cluster id: results}) for actions sent to other clusters
+        self.remote_tasks = set()
+        self.index_queue = asyncio.Queue()  # Unchunked guilds waiting for their member list
+        self.indexed_guilds = set()  # Unchunked guilds already read into the index
+        self.index_task = None
+        logger.info("Moderation cog loaded!")
+
+    async def cog_load(self):
+        # On a reload the ready event has already fired; at startup on_ready rebuilds it
+        if self.bot.is_ready():
+            self.shared_guilds.rebuild(self.bot.guilds)
+            self.queue_unchunked(self.bot.guilds)
+        self.index_task = asyncio.create_task(self.index_unchunked_guilds())
+        self.verify_shared_guilds.start()
+        if self.bot.ipc is not None:
+            # Each cluster only holds its own guilds, so cross-server actions are relayed through the hub
+            await self.bot.ipc.watch("modaction:", self.on_remote_action)
+            await self.bot.ipc.watch("modresult:", self.on_remote_result)
+
+    async def cog_unload(self):
+        self.verify_shared_guilds.cancel()
+        if self.index_task is not None:
+            self.index_task.cancel()
+        for task in self.remote_tasks:
+            task.cancel()
+
+    @tasks.loop(hours=1)
+    async def verify_shared_guilds(self):
+        missing, stale = self.shared_guilds.check_consistency(self.bot.guilds)
+        if missing or stale:
+            logger.warning(f"Shared guild index drifted ({len(missing)} missing, {len(stale)} stale), rebuilding.")
+            self.shared_guilds.rebuild(self.bot.guilds)
+
+    @verify_shared_guilds.before_loop
+    async def before_verify_shared_guilds(self):
+        await self.bot.wait_until_ready()
+
+    def queue_unchunked(self, guilds):
+        for guild in guilds:
+            if not guild.chunked and guild.id not in self.indexed_guilds:
+                self.index_queue.put_nowait(guild.id)
+
+    async def index_unchunked_guilds(self):
+        """Read each unchunked guild's member list into the index once, without caching the members.
+
+        One gateway member request per guild, one guild at a time, so cross-server
+        actions never have to look a member up in every guild over REST.
+        """
+        while True:
+            guild_id = await self.index_queue.get()
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.chunked or guild_id in self.indexed_guilds:
+                continue
+            try:
+                members = await guild.chunk(cache=False)
+            except Exception as e:
+                logger.error(f"Could not read the member list of {guild_id} into the shared guild index: {e}")
+                continue
+            self.shared_guilds.add_members(guild_id, members)
+            self.indexed_guilds.add(guild_id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.shared_guilds.rebuild(self.bot.guilds)
+        self.queue_unchunked(self.bot.guilds)
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # Fired once the guild's members have been chunked into the cache
+        self.shared_guilds.add_guild(guild)
+        self.queue_unchunked([guild])
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.shared_guilds.add_guild(guild)
+        self.queue_unchunked([guild])
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.shared_guilds.remove_guild(guild.id)
+        self.indexed_guilds.discard(guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.shared_guilds.add(member.id, member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # Raw variant so removals of uncached members still update the index
+        self.shared_guilds.discard(payload.user.id, payload.guild_id)
+
+    async def _run_guild_action(self, guild, user_id, action):
+        """``(guild name, error or None)``, or None if the user turned out not to be in the guild."""
+        async with self.fanout_limit:
+            # The index says they're here; the member cache may not hold them
+            target = guild.get_member(user_id) or discord.Object(user_id)
+            try:
+                await self.bot.outbound.call(
+                    lambda: action(guild, target), priority=MODERATION, bucket=("guild", guild.id), label=f"moderation in {guild.id}"
+                )
+                return guild.name, None
+            except discord.NotFound as e:
+                if isinstance(target, discord.Member):
+                    return guild.name, e.text or f"HTTP {e.status}"
+                # A stale index entry for a member who left while uncached
+                self.shared_guilds.discard(user_id, guild.id)
+                return None
+            except ActionRefused as e:
+                return guild.name, str(e)
+            except discord.HTTPException as e:
+                return guild.name, e.text or f"HTTP {e.status}"
+            except Exception as e:
+                return guild.name, str(e) or type(e).__name__
+
+    async def run_fan_out(self, user_id: int, action, progress=None) -> list:
+        """Run ``action(guild, target)`` in every guild of this process shared with ``user_id``.
+
+        Returns ``(guild name, error or None)`` pairs; ``progress(checked, total)``
+        is awaited after each guild.
+        """
+        guild_ids = self.shared_guilds.guilds_for(user_id)
+        guilds = [guild for guild in map(self.bot.get_guild, guild_ids) if guild is not None]
+        tasks = [asyncio.create_task(self._run_guild_action(guild, user_id, action)) for guild in guilds]
+        results = []
+        for checked, next_done in enumerate(asyncio.as_completed(tasks), 1):
+            result = await next_done
+            if result is not None:
+                results.append(result)
+            if progress is not None:
+                await progress(checked, len(tasks))
+        return results
+
+    async def run_remote(self, kind: str, user_id: int, value: Optional[str]):
+        """Have the other cluster processes run the action in their guilds.
+
+        Returns their ``(guild name, error or None)`` pairs and how many clusters
+        didn't answer within ``REMOTE_FANOUT_TIMEOUT``.
+        """
+        ipc = self.bot.ipc
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        answers = {}
+        self.remote_requests[request_id] = (future, answers)
+        try:
+            await ipc.set(f"modaction:{request_id}", {"origin": self.bot.cluster_id, "kind": kind, "user_id": user_id, "value": value})
+            try:
+                await asyncio.wait_for(future, REMOTE_FANOUT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            del self.remote_requests[request_id]
+            await ipc.delete(f"modaction:{request_id}")
+            for cluster in list(answers):
+                await ipc.delete(f"modresult:{request_id}:{cluster}")
+        results = [tuple(pair) for answer in answers.values() for pair in answer]
+        return results, self.bot.cluster_count - 1 - len(answers)
+
+    def on_remote_action(self, key: str, request):
+        if request is None or request["origin"] == self.bot.cluster_id:
+            return
+        task = asyncio.create_task(self.run_remote_action(key.split(":", 1)[1], request))
+        self.remote_tasks.add(task)
+        task.add_done_callback(self.remote_tasks.discard)
+
+    async def run_remote_action(self, request_id: str, request: dict):
+        try:
+            results = await self.run_fan_out(request["user_id"], build_action(request["kind"], request["value"]))
+            await self.bot.ipc.set(f"modresult:{request_id}:{self.bot.cluster_id}", results)
+        except Exception as e:
+            logger.error(f"Relayed {request['kind']} of {request['user_id']} failed: {e}")
+
+    def on_remote_result(self, key: str, results):
+        if results is None:
+            return
+        _, request_id, cluster = key.split(":")
+        pending = self.remote_requests.get(request_id)
+        if pending is None:
+            return
+        future, answers = pending
+        answers[cluster] = results
+        if len(answers) >= self.bot.cluster_count - 1 and not future.done():
+            future.set_result(None)
+
+    async def fan_out(self, interaction: discord.Interaction, member: discord.abc.User, kind: str, value: Optional[str]):
+        """Run the ``kind`` action in every guild shared with `member`, on every cluster process.
+
+        The interaction is deferred first, progress is streamed into the original
+        response, and the final edit is a per-guild success/failure report.
+        """
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        verb = ACTION_VERBS[kind]
+        remote = None
+        if self.bot.ipc is not None and self.bot.cluster_count > 1:
+            remote = asyncio.create_task(self.run_remote(kind, member.id, value))
+
+        last_edit = time.monotonic()
+
+        async def progress(checked, total):
+            nonlocal last_edit
+            now = time.monotonic()
+            if checked < total and now - last_edit >= PROGRESS_EDIT_INTERVAL:
+                last_edit = now
+                try:
+                    await interaction.edit_original_response(content=f"{verb} {member.mention}... {checked}/{total} server(s) done.")
+                except discord.HTTPException:
+                    pass
+
+        results = await self.run_fan_out(member.id, build_action(kind, value), progress)
+        unanswered = 0
+        if remote is not None:
+            remote_results, unanswered = await remote
+            results += remote_results
+
+        successes = [name for name, err in results if err is None]
+        failures = [(name, err) for name, err in results if err is not None]
+        lines = [f"{verb} {member.mention} in {len(successes)} server(s). Failed in {len(failures)} server(s)."]
+        if unanswered:
+            lines.append(f"⚠️ {unanswered} other bot process(es) didn't answer; servers they host may be unchanged.")
+        lines += [f"✅ {name}" for name in successes]
+        lines += [f"❌ {name} — {err}" for name, err in failures]
+        report = "\n".join(lines)
+        if len(report) > 2000:
+            report = report[:1997] + "..."
+        await interaction.edit_original_response(content=report)
+        return results
 
     @app_commands.command(name="nickname", description="Change a member's nickname in every server the bot shares with them.")
     @app_commands.checks.has_permissions(manage_nicknames=True)
     async def nickname(self, interaction: discord.Interaction, member: discord.Member, nickname: Optional[str] = None):
-        successes = 0
-        failures = 0
-        for guild in self.bot.guilds:
-            try:
-                target = guild.get_member(member.id)
-                if not target:
-                    continue
-                bot_member = guild.me
-                if not bot_member.guild_permissions.manage_nicknames:
-                    failures += 1
-                    continue
-                if target.top_role >= bot_member.top_role:
-                    failures += 1
-                    continue
-                await target.edit(nick=nickname)
-                successes += 1
-            except Exception:
-                failures += 1
-        await interaction.response.send_message(
-            f"Nickname changed in {successes} server(s). Failed in {failures} server(s).",
-            ephemeral=True
-        )
+        await self.fan_out(interaction, member, "nickname", nickname)
 
     @app_commands.command(name="ban", description="Ban a member from all servers the bot shares with them.")
     @app_commands.checks.has_permissions(ban_members=True)
     async def ban(self, interaction: discord.Interaction, member: discord.Member, reason: Optional[str] = None):
-        successes = 0
-        failures = 0
-        for guild in self.bot.guilds:
-            try:
-                target = guild.get_member(member.id)
-                if not target:
-                    continue
-                await target.ban(reason=reason)
-                successes += 1
-            except Exception:
-                failures += 1
-        await interaction.response.send_message(
-            f"Banned {member.mention} in {successes} server(s). Failed in {failures} server(s).",
-            ephemeral=True
-        )
+        await self.fan_out(interaction, member, "ban", reason)
 
     @app_commands.command(name="kick", description="Kick a member from all servers the bot shares with them.")
     @app_commands.checks.has_permissions(kick_members=True)
     async def kick(self, interaction: discord.Interaction, member: discord.Member, reason: Optional[str] = None):
-        successes = 0
-        failures = 0
-        for guild in self.bot.guilds:
-            try:
-                target = guild.get_member(member.id)
-                if not target:
-                    continue
-                await target.kick(reason=reason)
-                successes += 1
-            except Exception:
-                failures += 1
-        await interaction.response.send_message(
-            f"Kicked {member.mention} in {successes} server(s). Failed in {failures} server(s).",
-            ephemeral=True
-        )
+        await self.fan_out(interaction, member, "kick", reason)
 
     async def cog_app_command_error(self, interaction: discord.Interaction, error):
         if isinstance(error, app_commands.errors.MissingPermissions):
@@ -79,12 +386,56 @@ class Moderation(commands.Cog):
             else:
                 await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
         else:
-            # If you want logging, import logging and set up a logger, or just print
-            print(f"An error occurred: {error}")
+            logger.error(f"An error occurred: {error}")
             if interaction.response.is_done():
                 await interaction.followup.send("An error occurred while processing the command.", ephemeral=True)
             else:
                 await interaction.response.send_message("An error occurred while processing the command.", ephemeral=True)
 
+def _benchmark(guilds: int = 1_500, members_per_guild: int = 300, users: int = 200_000, lookups: int = 10_000):
+    """Shared-guild lookup via the index vs. checking every guild's member map, as fan-out did before."""
+    import random
+    import tracemalloc
+    from types import SimpleNamespace
+
+    rng = random.Random(1)
+    fake_guilds = []
+    for guild_id in range(1, guilds + 1):
+        member_ids = rng.sample(range(users), members_per_guild)
+        fake_guilds.append(SimpleNamespace(id=guild_id, chunked=True, members=[SimpleNamespace(id=i) for i in member_ids], by_id=set(member_ids)))
+    queries = [rng.randrange(users) for _ in range(lookups)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SharedGuildIndex()
+    index.rebuild(fake_guilds)
+    built = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for user_id in queries:
+        [g.id for g in fake_guilds if user_id in g.by_id]
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    for user_id in queries:
+        index.guilds_for(user_id)
+    indexed = time.perf_counter() - start
+
+    # A chunk arriving for one guild, as after /massrole on an unchunked guild
+    chunk = [SimpleNamespace(id=rng.randrange(users)) for _ in range(1000)]
+    start = time.perf_counter()
+    index.add_members(guilds + 1, chunk)
+    chunked = time.perf_counter() - start
+
+    print(f"{guilds} guilds x {members_per_guild} members: index built in {built * 1000:.0f}ms, "
+          f"{len(index):,} users, {size / 1024 / 1024:.1f} MiB")
+    print(f"scan every guild: {scan / lookups * 1e6:.1f}us per lookup")
+    print(f"index:            {indexed / lookups * 1e6:.2f}us per lookup")
+    print(f"1000-member chunk applied in {chunked * 1000:.2f}ms")
+
 async def setup(bot):
-    await bot.add_cog(Moderation(bot)) 
\ No newline at end of file
+    await bot.add_cog(Moderation(bot))
+
+if __name__ == "__main__":
+    _benchmark()
\ No newline at end of file
@@ -0,0 +1,234 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger('discord_bot')
+
+# Lower runs first. Interaction responses don't go through the scheduler: they use the
+# interaction's own token (not the bot's rate limits) and must answer within 3 seconds.
+MODERATION = 0   # bans, kicks, timeouts, purges
+INTERACTIVE = 1  # messages someone is waiting for (ticket threads, transcripts)
+BULK = 2         # mass role changes, temp role expiry
+BACKGROUND = 3   # log embeds, training embed edits, troll replies
+PRIORITY_NAMES = ("moderation", "interactive", "bulk", "background")
+
+# Tokens per period for each kind of bucket key; roughly Discord's published per-route limits
+DEFAULT_BUCKET_LIMITS = {
+    "channel": (5, 5.0),
+    "guild": (10, 10.0),
+    "webhook": (5, 2.0),
+}
+
+class OutboundDropped(Exception):
+    """The request waited past its deadline and was never sent."""
+
+class TokenBucket:
+    __slots__ = ("key", "capacity", "per", "tokens", "updated", "queue")
+
+    def __init__(self, key, capacity: int, per: float, now: float):
+        self.key = key
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = now
+        self.queue = []  # Heap of (priority, seq, OutboundRequest)
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+
+    def time_until_token(self) -> float:
+        return (1 - self.tokens) * self.per / self.capacity
+
+class OutboundRequest:
+    __slots__ = ("fn", "priority", "deadline", "label", "future", "submitted")
+
+    def __init__(self, fn, priority: int, deadline: Optional[float], label: str, future, submitted: float):
+        self.fn = fn
+        self.priority = priority
+        self.deadline = deadline
+        self.label = label
+        self.future = future
+        self.submitted = submitted
+
+class OutboundScheduler:
+    """Single queue for the bot's own API calls, so raids don't stall bans behind log spam.
+
+    Callers pass a zero-argument function returning the awaitable to run (e.g.
+    ``lambda: channel.send(...)``), a priority class and the rate limit bucket it
+    falls into, such as ``("channel", channel.id)`` or ``("guild", guild.id)``.
+    Whenever a request slot and a token in both its bucket and the global bucket are
+    free, the highest-priority waiting request runs. Requests with a ``ttl`` that
+    wait longer than that are dropped instead of sent late.
+    """
+
+    def __init__(self, *, concurrency: int = 10, global_per_second: float = 45, bucket_limits: Optional[dict] = None):
+        self.concurrency = concurrency
+        self.global_per_second = global_per_second
+        self.bucket_limits = {**DEFAULT_BUCKET_LIMITS, **(bucket_limits or {})}
+        self._seq = itertools.count()
+        self._buckets = {}  # Maps bucket key -> TokenBucket
+        self._active = {}  # Buckets with queued requests
+        self._global = None
+        self._in_flight = set()  # Running tasks, referenced so they aren't garbage collected
+        self._timer = None
+        self._timer_at = None
+        self.depth = [0] * len(PRIORITY_NAMES)
+        self.submitted = [0] * len(PRIORITY_NAMES)
+        self.dropped = [0] * len(PRIORITY_NAMES)
+        self.failed = [0] * len(PRIORITY_NAMES)
+        # Log2 histogram of queue wait per priority: wait_buckets[p][k] counts waits of 2**(k-1) <= ns < 2**k
+        self.wait_buckets = [[0] * 65 for _ in PRIORITY_NAMES]
+        self.wait_ns = [0] * len(PRIORITY_NAMES)
+
+    def _bucket(self, key, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            capacity, per = self.bucket_limits.get(key[0] if key else None, (self.global_per_second, 1.0))
+            bucket = self._buckets[key] = TokenBucket(key, capacity, per, now)
+        return bucket
+
+    def _enqueue(self, fn, priority: int, bucket, ttl: Optional[float], label: str, future):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._global is None:
+            self._global = TokenBucket(None, self.global_per_second, 1.0, now)
+        request = OutboundRequest(fn, priority, now + ttl if ttl is not None else None, label, future, now)
+        target = self._bucket(bucket, now)
+        heapq.heappush(target.queue, (priority, next(self._seq), request))
+        self._active[target.key] = target
+        self.depth[priority] += 1
+        self.submitted[priority] += 1
+        self._dispatch()
+
+    def submit(self, fn, *, priority: int = BACKGROUND, bucket=None, ttl: Optional[float] = None, label: str = ""):
+        """Queue ``fn()`` without waiting for it; failures are logged."""
+        self._enqueue(fn, priority, bucket, ttl, label, None)
+
+    async def call(self, fn, *, priority: int = INTERACTIVE, bucket=None, ttl: Optional[float] = None, label: str = ""):
+        """Queue ``fn()`` and return its result. Raises :class:`OutboundDropped` if it expired first."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(fn, priority, bucket, ttl, label, future)
+        return await future
+
+    def _drop(self, request: OutboundRequest):
+        self.depth[request.priority] -= 1
+        self.dropped[request.priority] += 1
+        if request.future is not None and not request.future.done():
+            request.future.set_exception(OutboundDropped(request.label))
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        wake_in = None
+        while len(self._in_flight) < self.concurrency and self._active:
+            self._global.refill(now)
+            if self._global.tokens < 1:
+                wake_in = self._global.time_until_token()
+                break
+            best = None
+            for key, bucket in list(self._active.items()):
+                queue = bucket.queue
+                while queue and queue[0][2].deadline is not None and queue[0][2].deadline < now:
+                    self._drop(heapq.heappop(queue)[2])
+                if not queue:
+                    del self._active[key]
+                    continue
+                bucket.refill(now)
+                if bucket.tokens < 1:
+                    wait = bucket.time_until_token()
+                    wake_in = wait if wake_in is None else min(wake_in, wait)
+                    continue
+                if best is None or queue[0] < best.queue[0]:
+                    best = bucket
+            if best is None:
+                break
+            _, _, request = heapq.heappop(best.queue)
+            if not best.queue:
+                del self._active[best.key]
+            best.tokens -= 1
+            self._global.tokens -= 1
+            self.depth[request.priority] -= 1
+            waited = int((now - request.submitted) * 1e9)
+            self.wait_buckets[request.priority][waited.bit_length()] += 1
+            self.wait_ns[request.priority] += waited
+            task = asyncio.create_task(self._execute(request))
+            self._in_flight.add(task)
+        if wake_in is not None:
+            self._wake_at(now + wake_in)
+
+    def _wake_at(self, when: float):
+        if self._timer is not None:
+            if self._timer_at <= when:
+                return
+            self._timer.cancel()
+        self._timer_at = when
+        self._timer = asyncio.get_running_loop().call_at(when, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    async def _execute(self, request: OutboundRequest):
+        try:
+            result = await request.fn()
+        except Exception as e:
+            self.failed[request.priority] += 1
+            if request.future is not None:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            else:
+                logger.error(f"Outbound {request.label or 'request'} failed: {e}")
+        else:
+            if request.future is not None and not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self._in_flight.discard(asyncio.current_task())
+            self._dispatch()
+
+    def report(self) -> str:
+        lines = []
+        for priority, name in enumerate(PRIORITY_NAMES):
+            sent = self.submitted[priority] - self.depth[priority] - self.dropped[priority]
+            avg_wait = self.wait_ns[priority] / sent / 1e6 if sent else 0
+            lines.append(
+                f"{name}: {self.depth[priority]} queued, {self.submitted[priority]} submitted, "
+                f"{self.dropped[priority]} dropped, {self.failed[priority]} failed, avg wait {avg_wait:.1f}ms"
+            )
+        lines.append(f"{len(self._in_flight)}/{self.concurrency} in flight, {len(self._active)} bucket(s) waiting")
+        return "\n".join(lines)
+
+async def _benchmark(bans: int = 100, log_embeds: int = 1_000, api_latency: float = 0.02):
+    """Raid simulation: a burst of log embeds arrives just before a wave of bans."""
+    async def api_call():
+        await asyncio.sleep(api_latency)
+
+    async def run(prioritized: bool):
+        # Generous per-bucket limits so the global limit and concurrency are what's contended
+        scheduler = OutboundScheduler(concurrency=10, global_per_second=200, bucket_limits={"channel": (1000, 1.0), "guild": (1000, 1.0)})
+        ban_waits = []
+
+        async def ban(n):
+            start = time.perf_counter()
+            await scheduler.call(api_call, priority=MODERATION if prioritized else BACKGROUND, bucket=("guild", 1), label="ban")
+            ban_waits.append(time.perf_counter() - start)
+
+        for i in range(log_embeds):
+            scheduler.submit(api_call, priority=BACKGROUND, bucket=("channel", i % 20), ttl=5.0, label="log")
+        await asyncio.gather(*(ban(n) for n in range(bans)))
+        while scheduler._in_flight or scheduler._active:
+            await asyncio.sleep(0.05)
+        ban_waits.sort()
+        dropped = scheduler.dropped[BACKGROUND]
+        return ban_waits[len(ban_waits) // 2], ban_waits[int(len(ban_waits) * 0.99)], dropped
+
+    for prioritized in (False, True):
+        p50, p99, dropped = await run(prioritized)
+        label = "prioritized" if prioritized else "FIFO"
+        print(f"{label}: ban wait p50 {p50 * 1000:.0f}ms, p99 {p99 * 1000:.0f}ms ({bans} bans behind {log_embeds} log embeds, {dropped} stale embeds dropped)")
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
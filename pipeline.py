@@ -0,0 +1,94 @@
+import logging
+import time
+from dedup import RecentIds
+
+logger = logging.getLogger('discord_bot')
+
+class Stage:
+    __slots__ = ("name", "predicate", "handler", "bots", "checked", "matched", "predicate_ns", "handler_ns", "errors", "buckets")
+
+    def __init__(self, name, predicate, handler, bots=False):
+        self.name = name
+        self.predicate = predicate
+        self.handler = handler
+        self.bots = bots
+        self.checked = 0
+        self.matched = 0
+        self.predicate_ns = 0
+        self.handler_ns = 0
+        self.errors = 0
+        # Log2 histogram of handler run time: buckets[k] counts runs of 2**(k-1) <= ns < 2**k
+        self.buckets = [0] * 65
+
+class MessagePipeline:
+    """Single entry point for incoming messages.
+
+    Cogs register a cheap synchronous ``predicate(message)`` together with an async
+    ``handler(message)``; handlers only run when their predicate matches.
+    Redelivered messages are filtered once up front. Messages from bots only reach
+    stages registered with ``bots=True`` and never run commands; prefix commands
+    are dispatched exactly once after all stages ran.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.stages = []
+        self.seen = RecentIds(window=300)
+        self.messages = 0
+        self.commands_ns = 0
+
+    def register(self, name: str, predicate, handler, *, bots: bool = False):
+        self.unregister(name)
+        self.stages.append(Stage(name, predicate, handler, bots))
+
+    def unregister(self, name: str):
+        self.stages = [stage for stage in self.stages if stage.name != name]
+
+    async def dispatch(self, message):
+        if self.seen.check_and_add(message.id):
+            return
+        from_bot = message.author.bot
+        self.messages += 1
+        for stage in self.stages:
+            if from_bot and not stage.bots:
+                continue
+            start = time.perf_counter_ns()
+            try:
+                matched = stage.predicate(message)
+            except Exception as e:
+                # Skips this stage only; the others and command dispatch still run
+                matched = False
+                stage.errors += 1
+                logger.error(f"Message stage {stage.name} predicate failed: {e}")
+            matched_at = time.perf_counter_ns()
+            stage.checked += 1
+            stage.predicate_ns += matched_at - start
+            if not matched:
+                continue
+            stage.matched += 1
+            try:
+                await stage.handler(message)
+            except Exception as e:
+                stage.errors += 1
+                logger.error(f"Message stage {stage.name} failed: {e}")
+            elapsed = time.perf_counter_ns() - matched_at
+            stage.handler_ns += elapsed
+            stage.buckets[elapsed.bit_length()] += 1
+
+        if from_bot:
+            return
+        start = time.perf_counter_ns()
+        await self.bot.process_commands(message)
+        self.commands_ns += time.perf_counter_ns() - start
+
+    def report(self) -> str:
+        lines = [f"{self.messages} message(s), {self.seen.hits} duplicate(s) dropped"]
+        for stage in self.stages:
+            avg_handler = stage.handler_ns / stage.matched / 1000 if stage.matched else 0
+            lines.append(
+                f"{stage.name}: {stage.matched}/{stage.checked} matched, "
+                f"predicates {stage.predicate_ns / 1e6:.1f}ms, handlers {stage.handler_ns / 1e6:.1f}ms "
+                f"(avg {avg_handler:.0f}us), {stage.errors} error(s)"
+            )
+        lines.append(f"commands: {self.commands_ns / 1e6:.1f}ms")
+        return "\n".join(lines)
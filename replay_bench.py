@@ -0,0 +1,724 @@
+"""Offline replay benchmark: drives the real cogs with synthetic gateway events.
+
+Builds a bot that never connects, loads the cogs against fake guilds, members,
+channels, messages and interactions, and replays an event stream through the
+message pipeline, the cogs' listeners and the ticket/training button callbacks.
+Every Discord API call a fake object receives is counted instead of sent.
+
+    python replay_bench.py                          # all scenarios
+    python replay_bench.py --scenario join_raid --events 20000
+    python replay_bench.py --record raid.jsonl      # save the generated stream
+    python replay_bench.py --replay raid.jsonl      # replay a recorded stream
+    python replay_bench.py --save-baseline base.json
+    python replay_bench.py --baseline base.json     # exit 1 on a regression
+    python replay_bench.py --member-cache --guilds 50 --members 5000
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import gc
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import discord
+from discord.ext import commands
+from bot_config import BotConfig, member_cache_flags
+from outbound import OutboundScheduler
+from pipeline import MessagePipeline
+from scheduler import Scheduler
+from tickets import TicketControls, TicketTypeSelect
+from training import AttendButton
+
+COGS = ['moderation', 'roles', 'tickets', 'training', 'event_tracker', 'troll']
+# Long enough for event_tracker's log batches and training's attendee edits to flush
+DRAIN_SECONDS = 2.5
+MEMBER_CACHE_POLICIES = ["all", "joined", "voice", "none"]
+# Members a large guild's GUILD_CREATE carries when it isn't chunked: the bot and the few in voice
+GUILD_CREATE_MEMBERS = 10
+WORDS = ["hello", "anyone", "up", "for", "a", "game", "the", "patch", "notes", "look", "great", "lol",
+         "did", "you", "see", "that", "server", "event", "tonight", "thanks", "order", "refund", "help"]
+
+class FakeHTTP:
+    """Stands in for Discord's REST API: counts calls per route, optionally waiting ``latency`` seconds each."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+
+    async def request(self, method: str, route: str):
+        self.calls[f"{method} {route}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+class FakeAsset:
+    def __init__(self, url: str):
+        self.url = url
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, position: int):
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{role_id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMember:
+    def __init__(self, world, user_id: int, guild, name: str, roles=(), nick=None, bot=False):
+        self.world = world
+        self.id = user_id
+        self.guild = guild
+        self.name = name
+        self.nick = nick
+        self.bot = bot
+        self.roles = list(roles)
+        self.mention = f"<@{user_id}>"
+        self.created_at = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        self.display_avatar = FakeAsset(f"https://cdn.example/avatars/{user_id}.png")
+
+    @property
+    def display_name(self) -> str:
+        return self.nick or self.name
+
+    def copy(self):
+        return FakeMember(self.world, self.id, self.guild, self.name, self.roles, self.nick, self.bot)
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.world.http.request("PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.world.http.request("DELETE", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+
+    async def edit(self, **fields):
+        await self.world.http.request("PATCH", "/guilds/{guild_id}/members/{user_id}")
+
+class FakeWebhook:
+    def __init__(self, world, webhook_id: int, name: str):
+        self.world = world
+        self.id = webhook_id
+        self.name = name
+        self.token = f"token{webhook_id}"
+        self.url = f"https://discord.com/api/webhooks/{webhook_id}/{self.token}"
+
+    async def send(self, content=None, **fields):
+        await self.world.http.request("POST", "/webhooks/{webhook_id}/{webhook_token}")
+
+class FakeMessage:
+    def __init__(self, world, message_id: int, channel, author, content: str, embeds=()):
+        self.world = world
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds)
+        self.attachments = []
+        self.mentions = []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}"
+        self.webhook_id = None
+        self.reference = None
+        self.interaction = None
+        self.interaction_metadata = None
+        self._state = None  # Read by commands.Context
+
+    async def delete(self, *, delay=None):
+        await self.world.http.request("DELETE", "/channels/{channel_id}/messages/{message_id}")
+
+    async def edit(self, **fields):
+        if "embed" in fields:
+            self.embeds = [fields["embed"]]
+        await self.world.http.request("PATCH", "/channels/{channel_id}/messages/{message_id}")
+        return self
+
+class FakeChannel:
+    def __init__(self, world, channel_id: int, guild, name: str):
+        self.world = world
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{channel_id}>"
+        self.jump_url = f"https://discord.com/channels/{guild.id}/{channel_id}"
+        self.hooks = []
+
+    async def send(self, content=None, **fields):
+        await self.world.http.request("POST", "/channels/{channel_id}/messages")
+        return FakeMessage(self.world, self.world.next_id(), self, self.world.bot_user, content or "", fields.get("embeds") or [])
+
+    async def webhooks(self):
+        await self.world.http.request("GET", "/channels/{channel_id}/webhooks")
+        return list(self.hooks)
+
+    async def create_webhook(self, *, name, **fields):
+        await self.world.http.request("POST", "/channels/{channel_id}/webhooks")
+        webhook = FakeWebhook(self.world, self.world.next_id(), name)
+        self.hooks.append(webhook)
+        return webhook
+
+    async def create_thread(self, *, name, **fields):
+        await self.world.http.request("POST", "/channels/{channel_id}/threads")
+        thread = self.world.add_channel(FakeChannel(self.world, self.world.next_id(), self.guild, name))
+        self.world.threads.append(thread)
+        return thread
+
+    async def edit(self, **fields):
+        await self.world.http.request("PATCH", "/channels/{channel_id}")
+
+    async def delete(self, **fields):
+        await self.world.http.request("DELETE", "/channels/{channel_id}")
+
+    async def history(self, **fields):
+        await self.world.http.request("GET", "/channels/{channel_id}/messages")
+        return
+        yield
+
+class FakeGuild:
+    def __init__(self, world, guild_id: int, name: str):
+        self.world = world
+        self.id = guild_id
+        self.name = name
+        self.shard_id = 0
+        self.chunked = True
+        self.channels = {}
+        self.members = {}
+        self.roles = {}
+        self.log_channel = None
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id: int):
+        return self.roles.get(role_id)
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def _callback(self):
+        self.done = True
+        await self.interaction.world.http.request("POST", "/interactions/{interaction_id}/{interaction_token}/callback")
+
+    async def send_message(self, content=None, **fields):
+        await self._callback()
+
+    async def defer(self, **fields):
+        await self._callback()
+
+    async def edit_message(self, **fields):
+        await self._callback()
+
+class FakeFollowup:
+    def __init__(self, world):
+        self.world = world
+
+    async def send(self, content=None, **fields):
+        await self.world.http.request("POST", "/webhooks/{application_id}/{interaction_token}")
+
+class FakeInteraction:
+    def __init__(self, world, client, user, channel, message=None):
+        self.world = world
+        self.id = world.next_id()
+        self.client = client
+        self.user = user
+        self.guild = channel.guild
+        self.channel = channel
+        self.message = message
+        self.command = None
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(world)
+
+class FakeRawEvent:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+class World:
+    """The fake guilds, channels, members and REST stub one replay runs against."""
+
+    def __init__(self, guilds: int, channels: int, members: int, http: FakeHTTP):
+        self.http = http
+        self._ids = iter(range(10**15, 10**16))
+        self.guilds = {}
+        self.channels = {}
+        self.threads = []  # Threads created during the replay, in order
+        self.trainings = []  # Training announcement messages
+        for g in range(guilds):
+            guild = FakeGuild(self, 1000 + g, f"guild-{g}")
+            self.guilds[guild.id] = guild
+            for r in range(10):
+                role = FakeRole(guild.id * 100 + r, f"role-{r}", r)
+                guild.roles[role.id] = role
+            for c in range(channels):
+                self.add_channel(FakeChannel(self, guild.id * 1000 + c, guild, f"channel-{c}"))
+            guild.log_channel = self.add_channel(FakeChannel(self, guild.id * 1000 + 999, guild, "logs"))
+            for m in range(members):
+                self.add_member(guild, 10**6 + m)
+        self.bot_user = FakeMember(self, 1, guild, "ReplayBot", bot=True)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add_channel(self, channel: FakeChannel) -> FakeChannel:
+        channel.guild.channels[channel.id] = channel
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self, guild: FakeGuild, user_id: int) -> FakeMember:
+        member = FakeMember(self, user_id, guild, f"user{user_id}")
+        guild.members[user_id] = member
+        return member
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+class ReplayTicketSelect(TicketTypeSelect):
+    """The ticket panel's select with a fixed choice, as if the user had picked it."""
+
+    def __init__(self, value: str):
+        super().__init__()
+        self.replay_value = value
+
+    @property
+    def values(self):
+        return [self.replay_value]
+
+class ReplayBot(commands.Bot):
+    """A bot that never connects; the gateway cache is the :class:`World`."""
+
+    def __init__(self, world: World, **kwargs):
+        super().__init__(**kwargs)
+        self.world = world
+        self.never_ready = asyncio.Event()
+
+    @property
+    def user(self):
+        return self.world.bot_user
+
+    @property
+    def guilds(self):
+        return list(self.world.guilds.values())
+
+    def get_guild(self, guild_id: int):
+        return self.world.guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int):
+        return self.world.get_channel(channel_id)
+
+    async def wait_until_ready(self):
+        # Never ready: startup tasks (reconciliation, index checks) stay parked as before a real connection
+        await self.never_ready.wait()
+
+async def build_bot(world: World, data_dir: str) -> ReplayBot:
+    """Load the real cogs with the same shared services bot.py sets up, storing their files in ``data_dir``."""
+    config = {}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    for key, name in (
+        ("journal_path", "events.db"), ("scheduler_store", "scheduled_jobs.json"), ("ticket_capture_dir", "ticket_logs"),
+        ("ticket_store", "tickets.db"), ("transcript_index", "transcripts.db"), ("training_store", "trainings.json"),
+    ):
+        config[key] = os.path.join(data_dir, name)
+    config["ghost_webhook_store"] = None
+    config["guilds"] = {str(guild.id): {"log_channel": guild.log_channel.id} for guild in world.guilds.values()}
+
+    bot = ReplayBot(world, command_prefix='!', intents=discord.Intents.all())
+    bot.CONFIG = config
+    bot.config = BotConfig(config)
+    bot.message_pipeline = MessagePipeline(bot)
+    bot.scheduler = Scheduler(config["scheduler_store"])
+    outbound = config.get("outbound", {})
+    bot.outbound = OutboundScheduler(
+        concurrency=outbound.get("concurrency", 10),
+        global_per_second=outbound.get("global_per_second", 45),
+        bucket_limits={kind: tuple(limit) for kind, limit in outbound.get("buckets", {}).items()},
+    )
+    bot.ipc = None
+    bot.scheduler.start()
+    for cog in COGS:
+        await bot.load_extension(cog)
+    return bot
+
+def generate_events(scenario: str, count: int, world: World, rng: random.Random) -> list:
+    """A JSON-serializable event stream; ids refer to the world's guilds, channels and members."""
+    guilds = list(world.guilds.values())
+    message_ids = itertools.count(2 * 10**15)
+    events = []
+    if scenario == "message_flood":
+        sent = []
+        ghosts = rng.sample(sorted(guilds[0].members), 3)
+        for user_id in ghosts:
+            events.append({"type": "ghost", "user": user_id, "target": rng.choice(sorted(guilds[0].members))})
+        for _ in range(count):
+            guild = rng.choice(guilds)
+            roll = rng.random()
+            if sent and roll < 0.05:
+                events.append({"type": "message_edit", **rng.choice(sent), "content": " ".join(rng.choices(WORDS, k=8))})
+            elif sent and roll < 0.08:
+                events.append({"type": "message_delete", **sent.pop(rng.randrange(len(sent)))})
+            else:
+                channel = rng.choice([c for c in guild.channels.values() if c is not guild.log_channel])
+                ids = {"guild": guild.id, "channel": channel.id, "id": next(message_ids)}
+                sent.append(ids)
+                events.append({"type": "message", **ids, "author": rng.choice(sorted(guild.members)),
+                               "content": " ".join(rng.choices(WORDS, k=rng.randint(1, 25)))})
+    elif scenario == "join_raid":
+        guild = guilds[0]
+        for i in range(count):
+            events.append({"type": "member_join", "guild": guild.id, "user": 5 * 10**6 + i})
+    elif scenario == "role_update":
+        for _ in range(count):
+            guild = rng.choice(guilds)
+            roles = sorted(guild.roles)
+            events.append({"type": "member_update", "guild": guild.id, "user": rng.choice(sorted(guild.members)),
+                           "add_roles": rng.sample(roles, rng.randint(0, 2)), "remove_roles": rng.sample(roles, rng.randint(0, 1)),
+                           "nick": rng.choice([None, None, None, f"nick{rng.randrange(1000)}"])})
+    elif scenario == "interactions":
+        guild = guilds[0]
+        panel = next(iter(guild.channels))
+        members = sorted(guild.members)
+        for i in range(5):
+            events.append({"type": "training_post", "guild": guild.id, "channel": panel, "host": members[i]})
+        opened = 0
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.2:
+                events.append({"type": "ticket_open", "guild": guild.id, "channel": panel, "user": rng.choice(members),
+                               "ticket_type": rng.choice(["support", "general", "report"])})
+                opened += 1
+            elif opened and roll < 0.35:
+                events.append({"type": "ticket_claim", "ticket": rng.randrange(opened), "user": rng.choice(members)})
+            else:
+                events.append({"type": "training_attend", "training": rng.randrange(5), "user": rng.choice(members)})
+    else:
+        raise ValueError(f"Unknown scenario {scenario!r}")
+    return events
+
+class Replayer:
+    """Turns event dicts into fake objects and runs them through the loaded bot."""
+
+    def __init__(self, bot: ReplayBot):
+        self.bot = bot
+        self.world = bot.world
+        self.listeners = collections.defaultdict(list)  # Maps event name -> [(label, coroutine function)]
+        for cog_name, cog in bot.cogs.items():
+            for event, method in cog.get_listeners():
+                self.listeners[event].append((f"{cog_name}.{event}", method))
+        self.handler_ns = collections.Counter()
+
+    async def dispatch(self, event: str, *args):
+        for label, listener in self.listeners[event]:
+            start = time.perf_counter_ns()
+            await listener(*args)
+            self.handler_ns[label] += time.perf_counter_ns() - start
+
+    async def replay(self, event: dict):
+        world = self.world
+        kind = event["type"]
+        if kind == "message":
+            channel = world.get_channel(event["channel"])
+            author = channel.guild.get_member(event["author"])
+            message = FakeMessage(world, event["id"], channel, author, event["content"])
+            start = time.perf_counter_ns()
+            await self.bot.message_pipeline.dispatch(message)
+            self.handler_ns["pipeline.dispatch"] += time.perf_counter_ns() - start
+        elif kind == "message_edit":
+            await self.dispatch("on_raw_message_edit", FakeRawEvent(
+                guild_id=event["guild"], channel_id=event["channel"], message_id=event["id"],
+                data={"content": event["content"]}, cached_message=None
+            ))
+        elif kind == "message_delete":
+            await self.dispatch("on_raw_message_delete", FakeRawEvent(
+                guild_id=event["guild"], channel_id=event["channel"], message_id=event["id"], cached_message=None
+            ))
+        elif kind == "member_join":
+            await self.dispatch("on_member_join", world.add_member(world.guilds[event["guild"]], event["user"]))
+        elif kind == "member_update":
+            guild = world.guilds[event["guild"]]
+            old = guild.get_member(event["user"])
+            new = old.copy()
+            new.roles = [r for r in old.roles if r.id not in event["remove_roles"]]
+            new.roles += [guild.get_role(r) for r in event["add_roles"] if guild.get_role(r) not in new.roles]
+            new.nick = event["nick"] if event["nick"] is not None else old.nick
+            guild.members[new.id] = new
+            await self.dispatch("on_member_update", old, new)
+        elif kind == "ghost":
+            target = world.guilds[next(iter(world.guilds))].get_member(event["target"])
+            await self.bot.get_cog("TrollCommands").set_ghosting(event["user"], {"name": target.display_name, "avatar_url": target.display_avatar.url})
+        elif kind == "ticket_open":
+            channel = world.get_channel(event["channel"])
+            interaction = FakeInteraction(world, self.bot, channel.guild.get_member(event["user"]), channel)
+            start = time.perf_counter_ns()
+            await ReplayTicketSelect(event["ticket_type"]).callback(interaction)
+            self.handler_ns["tickets.TicketTypeSelect"] += time.perf_counter_ns() - start
+        elif kind == "ticket_claim":
+            thread = world.threads[event["ticket"]]
+            message = FakeMessage(world, world.next_id(), thread, world.bot_user, "")
+            interaction = FakeInteraction(world, self.bot, thread.guild.get_member(event["user"]), thread, message)
+            start = time.perf_counter_ns()
+            await TicketControls().claim_ticket.callback(interaction)
+            self.handler_ns["tickets.claim_ticket"] += time.perf_counter_ns() - start
+        elif kind == "training_post":
+            channel = world.get_channel(event["channel"])
+            embed = discord.Embed(title="Training")
+            embed.add_field(name=":busts_in_silhouette: Attendees:", value="None yet", inline=False)
+            message = FakeMessage(world, world.next_id(), channel, world.bot_user, "", [embed])
+            self.bot.get_cog("Training").store.create(message.id, event["host"])
+            world.trainings.append(message)
+        elif kind == "training_attend":
+            message = world.trainings[event["training"]]
+            interaction = FakeInteraction(world, self.bot, message.guild.get_member(event["user"]), message.channel, message)
+            start = time.perf_counter_ns()
+            await AttendButton().callback(interaction)
+            self.handler_ns["training.AttendButton"] += time.perf_counter_ns() - start
+        else:
+            raise ValueError(f"Unknown event type {kind!r}")
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def run_scenario(name: str, events: list, world_args: dict, *, trace_allocations: bool, http_latency: float) -> dict:
+    random.seed(1)  # TrollCommands.mimic rolls random()
+    with tempfile.TemporaryDirectory() as data_dir:
+        world = World(http=FakeHTTP(http_latency), **world_args)
+        bot = await build_bot(world, data_dir)
+        replayer = Replayer(bot)
+        setup = [e for e in events if e["type"] in ("ghost", "training_post")]
+        timed = [e for e in events if e["type"] not in ("ghost", "training_post")]
+        for event in setup:
+            await replayer.replay(event)
+        world.http.calls.clear()
+
+        if trace_allocations:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        latencies = []
+        start = time.perf_counter()
+        for event in timed:
+            event_start = time.perf_counter_ns()
+            await replayer.replay(event)
+            latencies.append(time.perf_counter_ns() - event_start)
+        elapsed = time.perf_counter() - start
+        allocations = None
+        if trace_allocations:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            diff = after.compare_to(before, "filename")
+            allocations = {
+                "retained_blocks_per_event": sum(stat.count_diff for stat in diff) / max(1, len(timed)),
+                "retained_bytes_per_event": sum(stat.size_diff for stat in diff) / max(1, len(timed)),
+                "peak_kib": peak / 1024,
+            }
+
+        # Batched log embeds and debounced edits go out after the events; count them too
+        await asyncio.sleep(DRAIN_SECONDS)
+        for cog in list(bot.cogs):
+            await bot.remove_cog(cog)
+        await bot.scheduler.stop()
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "events": len(timed),
+        "events_per_sec": len(timed) / elapsed if elapsed else 0.0,
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "rest_calls_per_event": world.http.total() / max(1, len(timed)),
+        "rest_routes": dict(world.http.calls.most_common(5)),
+        "handlers_ms": {label: ns / 1e6 for label, ns in replayer.handler_ns.most_common(6)},
+        "allocations": allocations,
+    }
+
+def print_result(result: dict):
+    print(f"{result['scenario']}: {result['events']} events, {result['events_per_sec']:,.0f} events/s, "
+          f"p50 {result['p50_us']:.1f}us, p99 {result['p99_us']:.1f}us, {result['rest_calls_per_event']:.3f} REST calls/event")
+    allocations = result["allocations"]
+    if allocations:
+        print(f"  allocations: {allocations['retained_blocks_per_event']:.1f} blocks / "
+              f"{allocations['retained_bytes_per_event']:.0f} bytes retained per event, peak {allocations['peak_kib']:,.0f} KiB")
+    for route, calls in result["rest_routes"].items():
+        print(f"  {calls:>8} {route}")
+    for label, ms in result["handlers_ms"].items():
+        print(f"  {ms:>10.1f}ms {label}")
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Regressions against a saved run: throughput or p99 worse than ``tolerance``, or more REST calls per event."""
+    problems = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if base is None:
+            continue
+        name = result["scenario"]
+        if result["events_per_sec"] < base["events_per_sec"] * (1 - tolerance):
+            problems.append(f"{name}: {result['events_per_sec']:,.0f} events/s vs {base['events_per_sec']:,.0f}")
+        if result["p99_us"] > base["p99_us"] * (1 + tolerance):
+            problems.append(f"{name}: p99 {result['p99_us']:.1f}us vs {base['p99_us']:.1f}us")
+        # The stream is deterministic, so any extra API call is a real change
+        if result["rest_calls_per_event"] > base["rest_calls_per_event"] + 1e-9:
+            problems.append(f"{name}: {result['rest_calls_per_event']:.3f} REST calls/event vs {base['rest_calls_per_event']:.3f}")
+    return problems
+
+def rss_bytes():
+    """Current resident set size, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        return None
+
+def measure_member_cache(policy: str, guilds: int, members: int) -> dict:
+    """RSS before and after discord.py builds ``guilds`` guilds under a ``member_cache`` policy.
+
+    Uses real Guild and Member objects, and every policy sees the same events: a
+    GUILD_CREATE carrying the first ``GUILD_CREATE_MEMBERS`` members, then the rest
+    arriving as GUILD_MEMBER_ADD. discord.py's own handlers apply the policy.
+    """
+    intents = discord.Intents.all()
+    client = discord.Client(intents=intents, member_cache_flags=member_cache_flags(policy, intents))
+    gc.collect()
+    before = rss_bytes()
+    kept = []
+    for n in range(guilds):
+        guild_id = 1_000_000 + n
+        count = min(members, GUILD_CREATE_MEMBERS)
+        data = {
+            "id": str(guild_id), "name": f"guild-{n}", "channels": [], "emojis": [], "stickers": [], "features": [],
+            "member_count": members,
+            "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                       "hoist": False, "managed": False, "mentionable": False}],
+            "members": [
+                {"user": {"id": str(guild_id * members + i), "username": f"user{i}", "discriminator": "0",
+                          "global_name": f"User {i}", "avatar": None},
+                 "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+                for i in range(count)
+            ],
+        }
+        guild = discord.Guild(data=data, state=client._connection)
+        client._connection._add_guild(guild)
+        for i in range(count, members):
+            client._connection.parse_guild_member_add({
+                "guild_id": str(guild_id),
+                "user": {"id": str(guild_id * members + i), "username": f"user{i}", "discriminator": "0",
+                         "global_name": f"User {i}", "avatar": None},
+                "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0,
+            })
+        kept.append(guild)
+    gc.collect()
+    after = rss_bytes()
+    return {"policy": policy, "cached_members": sum(len(guild.members) for guild in kept), "rss_before": before, "rss_after": after}
+
+def print_member_cache(guilds: int, members: int):
+    # One fresh process per policy, so freed memory from the previous one doesn't hide growth
+    print(f"member cache: {guilds} guilds x {members:,} members")
+    for policy in MEMBER_CACHE_POLICIES:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--member-cache-policy", policy, "--guilds", str(guilds), "--members", str(members)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output)
+        if result["rss_before"] is None:
+            print(f"  {policy:>6}: {result['cached_members']:>10,} members cached (RSS not readable on this platform)")
+            continue
+        mib = 1024 * 1024
+        print(f"  {policy:>6}: {result['cached_members']:>10,} members cached, RSS {result['rss_before'] / mib:,.1f} -> "
+              f"{result['rss_after'] / mib:,.1f} MiB (+{(result['rss_after'] - result['rss_before']) / mib:,.1f})")
+
+def main():
+    scenarios = ["message_flood", "join_raid", "role_update", "interactions"]
+    parser = argparse.ArgumentParser(description="Replay synthetic gateway events through the cogs without connecting to Discord.")
+    parser.add_argument("--scenario", choices=scenarios + ["all"], default="all")
+    parser.add_argument("--events", type=int, default=10_000, help="events per scenario")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=10, help="channels per guild")
+    parser.add_argument("--members", type=int, default=2_000, help="members per guild")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="seconds each stubbed REST call takes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--record", help="write the generated event stream to this JSONL file")
+    parser.add_argument("--replay", help="replay a recorded JSONL event stream instead of generating one")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput/p99 regression (default 20%%)")
+    parser.add_argument("--member-cache", action="store_true", help="measure RSS of the member cache under each member_cache setting")
+    parser.add_argument("--member-cache-policy", choices=MEMBER_CACHE_POLICIES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.member_cache_policy:
+        print(json.dumps(measure_member_cache(args.member_cache_policy, args.guilds, args.members)))
+        return
+    if args.member_cache:
+        print_member_cache(args.guilds, args.members)
+        return
+    if args.record and args.scenario == "all":
+        parser.error("--record needs a single --scenario")
+
+    world_args = {"guilds": args.guilds, "channels": args.channels, "members": args.members}
+    streams = []
+    if args.replay:
+        with open(args.replay, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            streams.append((header["scenario"], [json.loads(line) for line in f]))
+        world_args = header["world"]
+    else:
+        world = World(http=FakeHTTP(), **world_args)
+        for name in scenarios if args.scenario == "all" else [args.scenario]:
+            streams.append((name, generate_events(name, args.events, world, random.Random(args.seed))))
+    if args.record:
+        name, events = streams[0]
+        with open(args.record, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"scenario": name, "world": world_args}) + "\n")
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    results = []
+    for name, events in streams:
+        result = asyncio.run(run_scenario(name, events, world_args, trace_allocations=False, http_latency=args.http_latency))
+        if not args.no_allocations:
+            # Separate pass: tracing would distort the timings
+            traced = asyncio.run(run_scenario(name, events, world_args, trace_allocations=True, http_latency=args.http_latency))
+            result["allocations"] = traced["allocations"]
+        print_result(result)
+        results.append(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({result["scenario"]: result for result in results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,60 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import logging
-import asyncio
+import time
+from datetime import datetime, timezone
 from typing import Optional
+from bulkjob import BulkJob
+from outbound import BULK
 
 logger = logging.getLogger('discord_bot')
 
+# Concurrent role edits per /massrole job; all of a guild's member edits share one rate-limit bucket
+MASSROLE_CONCURRENCY = 5
+
 class Roles(commands.Cog):
+    massrole = app_commands.Group(name="massrole", description="Add or remove a role for many members at once.")
+
     def __init__(self, bot):
         self.bot = bot
+        self.mass_jobs = {}  # Maps guild id -> running BulkJob
+
+    async def cog_load(self):
+        self.bot.scheduler.register("temprole", self.expire_temproles)
+
+    async def expire_temproles(self, jobs):
+        # One role edit per member, however many of their temp roles expire together
+        expired = {}
+        for job in jobs:
+            key = (job.data["guild_id"], job.data["member_id"])
+            expired.setdefault(key, []).append(job)
+        for (guild_id, member_id), member_jobs in expired.items():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue  # The bot left the guild
+            if guild.unavailable:
+                # Outage; try again once Discord serves the guild rather than leave the role forever
+                for job in member_jobs:
+                    self.bot.scheduler.retry(job)
+                continue
+            roles = [role for role in (guild.get_role(job.data["role_id"]) for job in member_jobs) if role is not None]
+            if not roles:
+                continue
+            try:
+                member = guild.get_member(member_id)
+                if member is None:
+                    # Not in a restricted member cache; fetch rather than leave the role in place
+                    member = await self.bot.outbound.call(
+                        lambda: guild.fetch_member(member_id), priority=BULK, bucket=("guild", guild_id), label=f"member lookup in {guild_id}",
+                    )
+                await self.bot.outbound.call(
+                    lambda: member.remove_roles(*roles, reason="Temporary role expired", atomic=len(roles) == 1),
+                    priority=BULK, bucket=("guild", guild_id), label=f"temp role expiry in {guild_id}",
+                )
+            except discord.NotFound:
+                continue  # Left the guild, so the role went with them
+            except discord.HTTPException as e:
+                logger.error(f"Failed to remove expired temp role(s) from {member_id} in {guild_id}: {e}")
 
     def _check_role_position(self, interaction: discord.Interaction, role: discord.Role) -> bool:
         return (role.position < interaction.user.top_role.position) or (interaction.user.id == interaction.guild.owner_id)
@@ -57,9 +103,12 @@ class Roles(commands.Cog):
             amount = int(duration[:-1])
             seconds = amount * time_units[unit]
             await member.add_roles(role)
+            self.bot.scheduler.schedule("temprole", time.time() + seconds, {
+                "guild_id": interaction.guild.id,
+                "member_id": member.id,
+                "role_id": role.id,
+            })
             await interaction.response.send_message(f"Added role {role.mention} to {member.mention} for {duration}", ephemeral=True)
-            await asyncio.sleep(seconds)
-            await member.remove_roles(role)
         except ValueError:
             await interaction.response.send_message("Invalid duration format. Use s/m/h/d (e.g., 1h, 30m)", ephemeral=True)
         except discord.Forbidden:
@@ -67,6 +116,87 @@ class Roles(commands.Cog):
         except discord.HTTPException:
             await interaction.response.send_message("An error occurred while managing roles.", ephemeral=True)
 
+    async def _start_massrole(self, interaction: discord.Interaction, role: discord.Role, adding: bool, has_role: Optional[discord.Role], joined_after: Optional[str]):
+        guild = interaction.guild
+        if not self._check_role_position(interaction, role) or role >= guild.me.top_role:
+            await interaction.response.send_message("That role is above your highest role or mine.", ephemeral=True)
+            return
+        job = self.mass_jobs.get(guild.id)
+        if job and not job.done:
+            await interaction.response.send_message(f"A mass role job is already running ({job.summary()}). Use `/massrole cancel` first.", ephemeral=True)
+            return
+        joined_cutoff = None
+        if joined_after:
+            try:
+                joined_cutoff = datetime.strptime(joined_after, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            except ValueError:
+                await interaction.response.send_message("Invalid date. Use YYYY-MM-DD (e.g., 2025-01-31)", ephemeral=True)
+                return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # With a restricted member cache the guild isn't chunked up front; fetch its members on demand
+        if guild.chunked:
+            all_members = guild.members
+        else:
+            all_members = await guild.chunk(cache=False)
+            shared_guilds = getattr(self.bot, "shared_guilds", None)
+            if shared_guilds is not None:
+                shared_guilds.add_members(guild.id, all_members)
+        members = [
+            m for m in all_members
+            if (has_role is None or m.get_role(has_role.id) is not None)
+            and (joined_cutoff is None or (m.joined_at and m.joined_at >= joined_cutoff))
+        ]
+        verb = "Adding" if adding else "Removing"
+        reason = f"/massrole by {interaction.user} ({interaction.user.id})"
+
+        async def action(member):
+            change = member.add_roles if adding else member.remove_roles
+            await self.bot.outbound.call(lambda: change(role, reason=reason), priority=BULK, bucket=("guild", guild.id), label=f"mass role in {guild.id}")
+
+        async def report(job):
+            text = f"{verb} {role.mention} — {job.summary()}"
+            try:
+                await interaction.edit_original_response(content=text)
+            except discord.HTTPException:
+                # The interaction token expires after 15 minutes; post the final result instead
+                if job.done:
+                    try:
+                        await interaction.channel.send(text)
+                    except discord.HTTPException:
+                        logger.error(f"Could not report mass role result in {guild.id}: {text}")
+
+        job = BulkJob(
+            members, action,
+            skip=lambda m: (m.get_role(role.id) is not None) == adding,
+            concurrency=MASSROLE_CONCURRENCY,
+            on_progress=report
+        )
+        self.mass_jobs[guild.id] = job
+        job.start()
+
+    @massrole.command(name="add", description="Give a role to every member matching the filters.")
+    @app_commands.describe(role="Role to give", has_role="Only members who have this role", joined_after="Only members who joined after this date (YYYY-MM-DD)")
+    @app_commands.checks.has_permissions(manage_roles=True)
+    async def massrole_add(self, interaction: discord.Interaction, role: discord.Role, has_role: Optional[discord.Role] = None, joined_after: Optional[str] = None):
+        await self._start_massrole(interaction, role, True, has_role, joined_after)
+
+    @massrole.command(name="remove", description="Remove a role from every member matching the filters.")
+    @app_commands.describe(role="Role to remove", has_role="Only members who have this role", joined_after="Only members who joined after this date (YYYY-MM-DD)")
+    @app_commands.checks.has_permissions(manage_roles=True)
+    async def massrole_remove(self, interaction: discord.Interaction, role: discord.Role, has_role: Optional[discord.Role] = None, joined_after: Optional[str] = None):
+        await self._start_massrole(interaction, role, False, has_role, joined_after)
+
+    @massrole.command(name="cancel", description="Cancel the running mass role job.")
+    @app_commands.checks.has_permissions(manage_roles=True)
+    async def massrole_cancel(self, interaction: discord.Interaction):
+        job = self.mass_jobs.get(interaction.guild.id)
+        if job is None or job.done:
+            await interaction.response.send_message("No mass role job is running.", ephemeral=True)
+            return
+        job.cancel()
+        await interaction.response.send_message("Cancelling mass role job...", ephemeral=True)
+
     async def cog_app_command_error(self, interaction: discord.Interaction, error):
         if isinstance(error, app_commands.errors.MissingPermissions):
             await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
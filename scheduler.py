@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+logger = logging.getLogger('discord_bot')
+
+# Jobs due within this many seconds of each other are fired as one batch
+BATCH_WINDOW = 1.0
+# Changes within this many seconds of each other are saved to the job file in one write
+SAVE_DELAY = 1.0
+# Default delay before a job a handler couldn't run yet (e.g. its guild is unavailable) is tried again
+RETRY_DELAY = 60.0
+
+class Job:
+    __slots__ = ("id", "kind", "due", "data")
+
+    def __init__(self, id: str, kind: str, due: float, data: dict):
+        self.id = id
+        self.kind = kind
+        self.due = due
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "due": self.due, "data": self.data}
+
+class Scheduler:
+    """Persistent delayed-job scheduler shared by all cogs as ``bot.scheduler``.
+
+    Jobs are kept in a min-heap ordered by due time (wall clock, so they survive
+    restarts) and saved to a JSON file, written off the event loop at most once
+    per ``SAVE_DELAY``; ``stop()`` writes what's left. A single task sleeps until the next
+    deadline; every job due at that point is handed to its kind's handler in one
+    batch, so many expiries at once cost one handler call. Jobs whose kind has no
+    handler yet wait until a cog registers one, and a handler that can't act on a
+    job yet hands it back with ``retry()`` instead of letting it be dropped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._jobs = {}  # Maps job id -> Job for every pending job
+        self._heap = []  # (due, seq, job id); cancelled ids are skipped lazily
+        self._seq = itertools.count()
+        self._handlers = {}  # Maps kind -> async handler(list of Job)
+        self._orphans = {}  # Maps kind -> due jobs waiting for a handler
+        self._running = set()
+        self._retrying = set()  # Ids handed back by a handler during the current batch
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._dirty = False
+        self._saver = None
+        self._save_lock = asyncio.Lock()  # Writes land in order, so an older snapshot never replaces a newer one
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load scheduled jobs from {self.path}: {e}")
+            return
+        for entry in saved:
+            self._add(Job(entry["id"], entry["kind"], entry["due"], entry["data"]))
+        logger.info(f"Restored {len(saved)} scheduled job(s)")
+
+    def save(self):
+        """Write the job file soon; every change until then shares the write."""
+        self._dirty = True
+        if self._saver is None or self._saver.done():
+            self._saver = asyncio.create_task(self._save_soon())
+
+    async def _save_soon(self):
+        while self._dirty:
+            await asyncio.sleep(SAVE_DELAY)
+            await self.flush()
+
+    def _write(self, entries: list):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Snapshot on the loop; only the JSON encoding and disk write run in the executor
+            entries = [job.to_dict() for job in self._jobs.values()]
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, entries)
+            except OSError as e:
+                self._dirty = True
+                logger.error(f"Could not save scheduled jobs to {self.path}: {e}")
+
+    def start(self, ready=None):
+        """Start firing jobs; with ``ready`` (e.g. ``bot.wait_until_ready``) nothing fires until it returns."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(ready))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def register(self, kind: str, handler):
+        self._handlers[kind] = handler
+        # Jobs that fell due before anyone could handle them run on the next pass
+        for job in self._orphans.pop(kind, []):
+            heapq.heappush(self._heap, (job.due, next(self._seq), job.id))
+        self._wakeup.set()
+
+    def pending(self, kind: Optional[str] = None) -> list:
+        return [job for job in self._jobs.values() if kind is None or job.kind == kind]
+
+    def schedule(self, kind: str, due: float, data: dict) -> str:
+        """Run ``kind``'s handler with this job at unix time ``due``. Returns the job id."""
+        job = Job(uuid.uuid4().hex, kind, due, data)
+        self._add(job)
+        self.save()
+        self._wakeup.set()
+        return job.id
+
+    def take(self, predicate) -> list:
+        """Remove and return the pending jobs matching ``predicate(job)``, e.g. to hand them to another process."""
+        taken = [job for job in self._jobs.values() if predicate(job)]
+        for job in taken:
+            del self._jobs[job.id]
+        if taken:
+            self.save()
+        return taken
+
+    def adopt(self, entry: dict):
+        """Add a job another process handed over (a ``Job.to_dict()``); ignored if it's already here."""
+        if entry["id"] in self._jobs:
+            return
+        self._add(Job(entry["id"], entry["kind"], entry["due"], entry["data"]))
+        self.save()
+        self._wakeup.set()
+
+    def retry(self, job: Job, delay: float = RETRY_DELAY):
+        """Keep a job its handler is running and fire it again after ``delay`` seconds."""
+        if self._jobs.get(job.id) is not job:
+            return
+        job.due = time.time() + delay
+        heapq.heappush(self._heap, (job.due, next(self._seq), job.id))
+        self._retrying.add(job.id)
+        self._wakeup.set()
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        self.save()
+        return True
+
+    def _add(self, job: Job):
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (job.due, next(self._seq), job.id))
+
+    async def _run(self, ready=None):
+        if ready is not None:
+            # Handlers need the guild cache; jobs that fell due while offline wait for it
+            await ready()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            due = {}
+            while self._heap and self._heap[0][0] <= now + BATCH_WINDOW:
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    due.setdefault(job.kind, []).append(job)
+            for kind, batch in due.items():
+                if kind in self._handlers:
+                    task = asyncio.create_task(self._fire(kind, batch))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+                else:
+                    self._orphans.setdefault(kind, []).extend(batch)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if timeout is not None and timeout <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, batch: list):
+        try:
+            await self._handlers[kind](batch)
+        except Exception as e:
+            logger.error(f"Scheduled {kind} job(s) failed: {e}")
+        # Removed only after the handler ran, so a crash mid-batch retries on restart
+        for job in batch:
+            if job.id in self._retrying:
+                self._retrying.discard(job.id)
+            else:
+                self._jobs.pop(job.id, None)
+        self.save()
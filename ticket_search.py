@@ -0,0 +1,170 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    thread_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    owner_id INTEGER,
+    closed_at REAL NOT NULL,
+    log_url TEXT
+);
+CREATE INDEX IF NOT EXISTS transcripts_guild ON transcripts (guild_id);
+CREATE TABLE IF NOT EXISTS transcript_chunks (
+    id INTEGER PRIMARY KEY,
+    thread_id INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcript_chunks_thread ON transcript_chunks (thread_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS transcript_chunk_fts USING fts5 (
+    content, content = 'transcript_chunks', content_rowid = 'id', tokenize = 'unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS transcript_chunks_insert AFTER INSERT ON transcript_chunks BEGIN
+    INSERT INTO transcript_chunk_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS transcript_chunks_delete AFTER DELETE ON transcript_chunks BEGIN
+    INSERT INTO transcript_chunk_fts (transcript_chunk_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+# Transcript lines per indexed chunk; all words of a search have to appear within one chunk
+CHUNK_LINES = 50
+
+def to_match_query(text: str) -> str:
+    """Turn free text into an FTS5 query that ANDs each word as a literal phrase.
+
+    Quoting keeps user input like ``order-1234`` or ``user:name`` from being parsed
+    as FTS5 operators.
+    """
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
+
+class TranscriptIndex:
+    """SQLite FTS5 index over closed ticket transcripts.
+
+    Each transcript is added once when its ticket closes, so indexing is
+    incremental. ``add_content()`` streams its lines into chunks of
+    ``CHUNK_LINES`` rows, so a transcript is never held as one string.
+    All database work runs on a dedicated thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-search")
+        self._conn = None
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._conn = conn
+
+    async def open(self):
+        await self._run(self._open)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+    def _add_content(self, thread_id, lines):
+        insert = "INSERT INTO transcript_chunks (thread_id, content) VALUES (?, ?)"
+        with self._conn:
+            self._conn.execute("DELETE FROM transcript_chunks WHERE thread_id = ?", (thread_id,))
+            chunk = []
+            for line in lines:
+                chunk.append(line.rstrip("\n"))
+                if len(chunk) == CHUNK_LINES:
+                    self._conn.execute(insert, (thread_id, "\n".join(chunk)))
+                    chunk = []
+            if chunk:
+                self._conn.execute(insert, (thread_id, "\n".join(chunk)))
+
+    async def add_content(self, thread_id: int, lines):
+        """Index a transcript's text, replacing any earlier version.
+
+        ``lines`` is a plain iterable consumed on the index thread, so it may read
+        from a file or spooled buffer.
+        """
+        await self._run(self._add_content, thread_id, lines)
+
+    def _add(self, thread_id, guild_id, name, owner_id, log_url):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts (thread_id, guild_id, name, owner_id, closed_at, log_url) VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, guild_id, name, owner_id, time.time(), log_url)
+            )
+
+    async def add(self, thread_id: int, guild_id: int, name: str, *, owner_id: Optional[int] = None, log_url: Optional[str] = None):
+        """Record a closed ticket; its text only turns up in searches once this is added."""
+        await self._run(self._add, thread_id, guild_id, name, owner_id, log_url)
+
+    def _search(self, guild_id, query, limit):
+        match = to_match_query(query)
+        if not match:
+            return []
+        # Several chunks of one transcript can match; keep each transcript's best-ranked one
+        results = {}
+        offset = 0
+        while len(results) < limit:
+            rows = self._conn.execute(
+                """
+                SELECT t.thread_id, t.name, t.owner_id, t.closed_at, t.log_url,
+                       snippet(transcript_chunk_fts, 0, '**', '**', '…', 16)
+                FROM transcript_chunk_fts
+                JOIN transcript_chunks c ON c.id = transcript_chunk_fts.rowid
+                JOIN transcripts t ON t.thread_id = c.thread_id
+                WHERE transcript_chunk_fts MATCH ? AND t.guild_id = ?
+                ORDER BY bm25(transcript_chunk_fts)
+                LIMIT ? OFFSET ?
+                """,
+                (match, guild_id, limit * 4, offset)
+            ).fetchall()
+            for row in rows:
+                results.setdefault(row[0], row)
+            if len(rows) < limit * 4:
+                break
+            offset += len(rows)
+        return list(results.values())[:limit]
+
+    async def search(self, guild_id: int, query: str, limit: int = 10) -> list:
+        """Best-ranked transcripts first, as ``(thread_id, name, owner_id, closed_at, log_url, snippet)``."""
+        return await self._run(self._search, guild_id, query, limit)
+
+async def _benchmark(transcripts: int = 20_000, lines: int = 60):
+    import os
+    import random
+    import tempfile
+
+    words = ["refund", "order", "payment", "ban", "appeal", "role", "help", "bug", "report", "server",
+             "thanks", "please", "account", "verify", "ticket", "staff", "issue", "error", "login", "support"]
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = TranscriptIndex(os.path.join(tmp, "bench.db"))
+        await index.open()
+        start = time.perf_counter()
+        for n in range(transcripts):
+            text = "\n".join(
+                f"[2025-01-01 12:00:00] user{rng.randrange(500)}: " + " ".join(rng.choices(words, k=12))
+                for _ in range(lines)
+            ) + f"\norder id ORD-{n:06d}"
+            await index.add_content(n + 1, text.split("\n"))
+            await index.add(n + 1, 1, f"ticket-{n:05d}")
+        indexed = time.perf_counter() - start
+        timings = []
+        for query in ["ORD-012345", "refund appeal", "user42 login error", "verify account staff"]:
+            start = time.perf_counter()
+            results = await index.search(1, query)
+            timings.append((query, time.perf_counter() - start, len(results)))
+        await index.close()
+    print(f"indexed {transcripts} transcripts in {indexed:.1f}s ({transcripts / indexed:,.0f}/s)")
+    for query, elapsed, found in timings:
+        print(f"search {query!r}: {elapsed * 1000:.1f}ms, {found} result(s)")
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
@@ -1,12 +1,58 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import os
 import datetime
 import asyncio
+import gzip
+import shutil
+import logging
+import tempfile
+from transcripts import TicketCapture
+from ticket_store import TicketStore
+from ticket_search import TranscriptIndex
+from outbound import INTERACTIVE
 
-# Transcript log channel ID
-TRANSCRIPT_LOG_CHANNEL_ID = 1383649876427931689
+logger = logging.getLogger('discord_bot')
+
+# Transcripts stay in memory up to this size, then spill to an anonymous temp file
+TRANSCRIPT_SPOOL_BYTES = 2 * 1024 * 1024
+# Transcripts larger than this are uploaded gzip-compressed
+TRANSCRIPT_GZIP_BYTES = 1024 * 1024
+
+def format_transcript_line(msg: discord.Message) -> str:
+    timestamp = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
+    author = msg.author.display_name
+    content = msg.content or ''
+    for attachment in msg.attachments:
+        content += f" [{attachment.filename}]({attachment.url})"
+    return f"[{timestamp}] {author}: {content}"
+
+async def spool_transcript(lines):
+    """Stream transcript lines into a spooled buffer.
+
+    ``lines`` is an async iterable of strings, so the whole transcript is never held
+    as a list.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_BYTES)
+    empty = True
+    async for line in lines:
+        buffer.write(line.encode("utf-8") + b"\n")
+        empty = False
+    if empty:
+        buffer.write(b"No messages found.")
+    return buffer
+
+def finish_transcript(buffer, name: str) -> discord.File:
+    """Gzip ``buffer`` if it is large and wrap it for upload."""
+    if buffer.tell() > TRANSCRIPT_GZIP_BYTES:
+        compressed = tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_BYTES)
+        buffer.seek(0)
+        with gzip.GzipFile(fileobj=compressed, mode="wb") as gz:
+            shutil.copyfileobj(buffer, gz)
+        buffer.close()
+        buffer, name = compressed, f"{name}.gz"
+    buffer.seek(0)
+    return discord.File(buffer, filename=name)
 
 class TicketDropdown(discord.ui.View):
     def __init__(self):
@@ -14,19 +60,17 @@ class TicketDropdown(discord.ui.View):
         self.add_item(TicketTypeSelect())
 
 class TicketTypeSelect(discord.ui.Select):
-    ticket_counter = 1
-
     def __init__(self):
         options = [
             discord.SelectOption(label="Support", value="support", description="Get help from our team", emoji="🛠️"),
             discord.SelectOption(label="General Question", value="general", description="Ask a general question", emoji="❓"),
             discord.SelectOption(label="Report User", value="report", description="Report a user to staff", emoji="🚨"),
         ]
-        super().__init__(placeholder="Select your ticket type...", min_values=1, max_values=1, options=options)
+        super().__init__(placeholder="Select your ticket type...", min_values=1, max_values=1, options=options, custom_id="ticket_type_select")
 
     async def callback(self, interaction: discord.Interaction):
-        ticket_number = TicketTypeSelect.ticket_counter
-        TicketTypeSelect.ticket_counter += 1
+        store = interaction.client.ticket_store
+        ticket_number = await store.allocate_number(interaction.client.ipc)
         thread_name = f"ticket-{ticket_number:03d}-{interaction.user.name}"
 
         thread = await interaction.channel.create_thread(
@@ -34,8 +78,13 @@ class TicketTypeSelect(discord.ui.Select):
             type=discord.ChannelType.public_thread
         )
 
-        support_mention = "<@&1360780843945033919>"
+        support_role_id = interaction.client.config.guild(interaction.guild.id).support_role_id
+        support_mention = f"<@&{support_role_id}>" if support_role_id else "Support"
         ticket_type = self.values[0].replace('_', ' ').title()
+        store.create(thread.id, ticket_number, interaction.user.id, self.values[0])
+        capture = interaction.client.ticket_capture
+        capture.open(thread.id, interaction.guild.id)
+        # Sent directly: the interaction response below must follow within 3 seconds
         await thread.send(
             f"Thank you for opening a ticket! {support_mention} will be with you shortly.\n**Ticket Type:** {ticket_type}",
             view=TicketControls()
@@ -49,23 +98,42 @@ class CloseOptionsView(discord.ui.View):
     @discord.ui.button(label="Transcript & Close Ticket", style=discord.ButtonStyle.red, custom_id="close_transcript")
     async def transcript_and_close(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
-        messages = []
-        async for msg in interaction.channel.history(limit=500, oldest_first=True):
-            timestamp = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-            author = msg.author.display_name
-            content = msg.content or ''
-            messages.append(f"[{timestamp}] {author}: {content}")
-        transcript_text = "\n".join(messages) or "No messages found."
-        filename = f"transcript_{interaction.channel.id}.txt"
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(transcript_text)
-        log_channel = interaction.guild.get_channel(TRANSCRIPT_LOG_CHANNEL_ID)
+        capture = interaction.client.ticket_capture
+        index = interaction.client.transcript_index
+        channel = interaction.channel
+        log_channel = interaction.client.config.channel(interaction.guild, "transcript_log_channel")
         if log_channel:
-            await log_channel.send(
-                content=f"Transcript for {interaction.channel.mention}:",
-                file=discord.File(filename)
+            name = f"transcript_{channel.id}"
+            if channel.id in capture.tickets:
+                # Replays the locally captured log; no history fetch needed
+                await capture.flush()
+                fmt = interaction.client.config.get("transcript_format", "html")
+                buffer = tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_BYTES)
+                await asyncio.to_thread(capture.export, channel.id, fmt, buffer, f"Transcript for #{channel.name}")
+                # Indexed in line batches straight from the capture log
+                await index.add_content(channel.id, capture.text_lines(channel.id))
+                transcript = finish_transcript(buffer, f"{name}.{fmt}")
+            else:
+                # Tickets opened before capture existed: paginate the full history instead
+                lines = (format_transcript_line(msg) async for msg in channel.history(limit=None, oldest_first=True))
+                buffer = await spool_transcript(lines)
+                buffer.seek(0)
+                await index.add_content(channel.id, (line.decode("utf-8") for line in buffer))
+                transcript = finish_transcript(buffer, f"{name}.txt")
+            try:
+                log_message = await interaction.client.outbound.call(
+                    lambda: log_channel.send(content=f"Transcript for {interaction.channel.mention}:", file=transcript),
+                    priority=INTERACTIVE, bucket=("channel", log_channel.id), label="transcript upload"
+                )
+            finally:
+                transcript.close()
+            ticket = interaction.client.ticket_store.get(channel.id) or {}
+            await index.add(
+                channel.id, interaction.guild.id, channel.name,
+                owner_id=ticket.get("owner_id"), log_url=log_message.jump_url
             )
-        os.remove(filename)
+        capture.discard(channel.id)
+        interaction.client.ticket_store.set_status(channel.id, "closed")
 
         await interaction.followup.send("📄 Transcript delivered. This ticket is now closed (locked).", ephemeral=True)
         await asyncio.sleep(2)
@@ -77,19 +145,24 @@ class CloseOptionsView(discord.ui.View):
         await interaction.response.send_message("🗑️ Deleting ticket...", ephemeral=True)
         await asyncio.sleep(2)
         await interaction.channel.delete()
+        interaction.client.ticket_capture.discard(interaction.channel.id)
+        interaction.client.ticket_store.remove(interaction.channel.id)
 
 class TicketControls(discord.ui.View):
-    def __init__(self):
+    # Registered once with bot.add_view and shared by every ticket, so claim state
+    # lives in the ticket store (keyed by thread id) rather than on the view
+    def __init__(self, claimed: bool = False):
         super().__init__(timeout=None)
-        self.claimed = False
+        self.claim_ticket.disabled = claimed
 
     @discord.ui.button(label="Claim Ticket", style=discord.ButtonStyle.blurple, custom_id="claim_ticket")
     async def claim_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.claimed:
+        store = interaction.client.ticket_store
+        if not await store.claim(interaction.channel.id, interaction.user.id):
+            if store.get(interaction.channel.id) is None:
+                return await interaction.response.send_message("This ticket is closed or isn't tracked, so it can't be claimed.", ephemeral=True)
             return await interaction.response.send_message("This ticket has already been claimed.", ephemeral=True)
-        self.claimed = True
-        button.disabled = True
-        await interaction.message.edit(view=self)
+        await interaction.message.edit(view=TicketControls(claimed=True))
         await interaction.response.send_message(f"Ticket claimed by {interaction.user.mention}.", ephemeral=False)
 
     @discord.ui.button(label="Close Ticket", style=discord.ButtonStyle.red, custom_id="show_close_options")
@@ -105,6 +178,75 @@ class Tickets(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.last_publish_time = {}  # Track last publish time per user
+        self.capture = TicketCapture(bot.CONFIG.get("ticket_capture_dir", "ticket_logs"), owns_guild=getattr(bot, "owns_guild", None))
+        bot.ticket_capture = self.capture
+        self.store = TicketStore(bot.CONFIG.get("ticket_store", "tickets.db"))
+        bot.ticket_store = self.store
+        self.index = TranscriptIndex(bot.CONFIG.get("transcript_index", "transcripts.db"))
+        bot.transcript_index = self.index
+
+    async def cog_load(self):
+        await self.store.open()
+        await self.index.open()
+        self.capture.start()
+        # Re-attach the panel and ticket buttons to messages sent before a restart
+        self.bot.add_view(TicketDropdown())
+        self.bot.add_view(TicketControls())
+        # Includes the bot's own claim and close notices, which belong in the transcript
+        self.bot.message_pipeline.register(
+            "tickets.capture", lambda message: message.channel.id in self.capture.tickets, self.capture_message, bots=True
+        )
+
+    async def cog_unload(self):
+        self.bot.message_pipeline.unregister("tickets.capture")
+        await self.capture.close()
+        await self.store.close()
+        await self.index.close()
+
+    @app_commands.command(name="ticketsearch", description="Search closed ticket transcripts.")
+    @app_commands.describe(query="Words, a username or an order id to look for")
+    @app_commands.checks.has_permissions(manage_messages=True)
+    async def ticketsearch(self, interaction: discord.Interaction, query: str):
+        results = await self.index.search(interaction.guild.id, query)
+        if not results:
+            await interaction.response.send_message(f"No transcripts match `{query}`.", ephemeral=True)
+            return
+        embed = discord.Embed(title=f"Transcripts matching \"{query}\"", color=discord.Color.blurple())
+        for thread_id, name, owner_id, closed_at, log_url, snippet in results:
+            opener = f"<@{owner_id}> • " if owner_id else ""
+            link = f" • [transcript]({log_url})" if log_url else ""
+            embed.add_field(
+                name=name,
+                value=f"{opener}closed <t:{int(closed_at)}:R>{link}\n{snippet}"[:1024],
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    async def capture_message(self, message: discord.Message):
+        self.capture.record_message(
+            message.channel.id, message.id, message.created_at, message.author.display_name,
+            message.author.id, message.content, [attachment.url for attachment in message.attachments]
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if payload.channel_id in self.capture.tickets and "content" in payload.data:
+            self.capture.record_edit(payload.channel_id, payload.message_id, payload.data["content"])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.channel_id in self.capture.tickets:
+            self.capture.record_delete(payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.channel_id in self.capture.tickets:
+            for message_id in payload.message_ids:
+                self.capture.record_delete(payload.channel_id, message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
+        self.capture.discard(payload.thread_id)
 
     @commands.command(name="publish")
     @commands.has_permissions(administrator=True)
@@ -130,7 +272,7 @@ class Tickets(commands.Cog):
         if isinstance(error, app_commands.errors.MissingPermissions):
             await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
         else:
-            print(f"Cog error: {error}")
+            logger.error(f"Cog error: {error}")
             await interaction.response.send_message("An error occurred.", ephemeral=True)
 
 async def setup(bot):
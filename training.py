@@ -1,10 +1,25 @@
 import asyncio
+import json
+import logging
+import os
+import re
+import time
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional
+from outbound import BACKGROUND
+from bot_config import BotConfig
 
-TARGET_CHANNEL_ID = 1384217951317786725
+logger = logging.getLogger('discord_bot')
+
+# Announcements are removed this long after the training starts
+TRAINING_DURATION = timedelta(hours=2)
+# Recent announcements checked at startup for ones that have no expiry scheduled
+RECONCILE_HISTORY_LIMIT = 200
+START_TIMESTAMP_RE = re.compile(r"<t:(\d+):R>")
+MENTION_RE = re.compile(r"<@!?(\d+)>")
 
 TRAINING_EMOJIS = {
     "Basic Cadet - Trooper Training": "🎓",
@@ -13,6 +28,108 @@ TRAINING_EMOJIS = {
     "Master FTO Training": "⭐",
 }
 
+# Clicks within this many seconds of each other are folded into one embed edit
+ATTENDEE_RENDER_DELAY = 2.0
+# Discord's limit on an embed field value
+EMBED_FIELD_LIMIT = 1024
+ATTENDEES_PLACEHOLDER = "Click the button below to sign up!"
+
+class TrainingStore:
+    """Host and attendees of each posted training, keyed by message id and saved to JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sessions = {}  # Maps message id -> {"host_id", "attendees": [user ids in sign-up order]}
+        self._attendee_sets = {}  # Maps message id -> set of attendee ids, for O(1) membership checks
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load trainings from {self.path}: {e}")
+            return
+        self.sessions = {int(message_id): session for message_id, session in saved.items()}
+        self._attendee_sets = {message_id: set(session["attendees"]) for message_id, session in self.sessions.items()}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(message_id): session for message_id, session in self.sessions.items()}, f)
+        os.replace(tmp_path, self.path)
+
+    def create(self, message_id: int, host_id: int):
+        self.sessions[message_id] = {"host_id": host_id, "attendees": []}
+        self._attendee_sets[message_id] = set()
+        self.save()
+
+    def get(self, message_id: int):
+        return self.sessions.get(message_id)
+
+    def remove(self, message_id: int):
+        self._attendee_sets.pop(message_id, None)
+        if self.sessions.pop(message_id, None) is not None:
+            self.save()
+
+    def add_attendee(self, message_id: int, user_id: int, embed: Optional[discord.Embed] = None) -> bool:
+        """Record ``user_id`` as attending. Returns False if they already were.
+
+        An announcement posted before attendees were tracked starts from the host
+        and attendees its ``embed`` already shows, so the next render keeps them.
+        """
+        if message_id not in self.sessions:
+            host_id, attendees = session_from_embed(embed) if embed else (None, [])
+            self.sessions[message_id] = {"host_id": host_id, "attendees": attendees}
+            self._attendee_sets[message_id] = set(attendees)
+        attendee_set = self._attendee_sets[message_id]
+        if user_id in attendee_set:
+            return False
+        attendee_set.add(user_id)
+        self.sessions[message_id]["attendees"].append(user_id)
+        return True
+
+def session_from_embed(embed: discord.Embed):
+    """``(host id, attendee ids)`` read back from a posted announcement's fields.
+
+    Attendees hidden behind "...and N more" can't be recovered.
+    """
+    host_id = None
+    attendees = []
+    for field in embed.fields:
+        if field.name.startswith(":arrow_right: Hosted By"):
+            match = MENTION_RE.search(field.value)
+            host_id = int(match.group(1)) if match else None
+        elif field.name.startswith(":busts_in_silhouette:"):
+            attendees = list(dict.fromkeys(int(user_id) for user_id in MENTION_RE.findall(field.value)))
+    return host_id, attendees
+
+def render_attendees(attendee_ids) -> str:
+    if not attendee_ids:
+        return ATTENDEES_PLACEHOLDER
+    lines = []
+    used = 0
+    for shown, user_id in enumerate(attendee_ids):
+        mention = f"<@{user_id}>"
+        more = f"...and {len(attendee_ids) - shown} more"
+        if used + len(mention) + 1 > EMBED_FIELD_LIMIT - len(more):
+            lines.append(more)
+            break
+        lines.append(mention)
+        used += len(mention) + 1
+    return "\n".join(lines)
+
+def training_end_time(embed: discord.Embed):
+    """Unix time a posted training ends, read back from its Start Time field."""
+    for field in embed.fields:
+        if field.name.startswith(":arrow_right: Start Time"):
+            match = START_TIMESTAMP_RE.search(field.value)
+            if match:
+                return int(match.group(1)) + TRAINING_DURATION.total_seconds()
+    return None
+
 class AttendButton(discord.ui.Button):
     def __init__(self):
         super().__init__(label="✅ Attending", style=discord.ButtonStyle.success, custom_id="attend")
@@ -22,43 +139,39 @@ class AttendButton(discord.ui.Button):
         if not message.embeds:
             await interaction.response.send_message("Error: No embed found.", ephemeral=True)
             return
-        embed = message.embeds[0]
-        attendees_index = None
-        for i, field in enumerate(embed.fields):
-            if field.name.startswith(":busts_in_silhouette:"):
-                attendees_index = i
-                break
-        if attendees_index is None:
-            await interaction.response.send_message("Error: Attendees field not found.", ephemeral=True)
-            return
-        attendees_value = embed.fields[attendees_index].value
-        if interaction.user.mention in attendees_value:
+        training = interaction.client.get_cog("Training")
+        if not training.store.add_attendee(message.id, interaction.user.id, message.embeds[0]):
             await interaction.response.send_message("You are already marked as attending!", ephemeral=True)
             return
-        if attendees_value.strip() == "Click the button below to sign up!":
-            new_attendees = interaction.user.mention
-        else:
-            new_attendees = attendees_value + "\n" + interaction.user.mention
-        embed.set_field_at(attendees_index, name=":busts_in_silhouette: Attendees:", value=new_attendees, inline=False)
-        await message.edit(embed=embed)
+        training.queue_render(message)
         await interaction.response.send_message("You have been marked as attending!", ephemeral=True)
 
 class CancelButton(discord.ui.Button):
-    def __init__(self, host_id: int):
+    def __init__(self):
         super().__init__(label="❌ Cancel Training", style=discord.ButtonStyle.danger, custom_id="cancel_training")
-        self.host_id = host_id
+
     async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.host_id:
+        training = interaction.client.get_cog("Training")
+        session = training.store.get(interaction.message.id)
+        if session is not None:
+            host_id = session["host_id"]
+        else:
+            # Posted before attendees were tracked: the embed still names the host
+            host_id = session_from_embed(interaction.message.embeds[0])[0] if interaction.message.embeds else None
+        if host_id is None or interaction.user.id != host_id:
             await interaction.response.send_message("Only the host can cancel this training.", ephemeral=True)
             return
         await interaction.message.delete()
+        training.store.remove(interaction.message.id)
+        training.cancel_expiry(interaction.message.id)
         await interaction.response.send_message("Training cancelled and message deleted.", ephemeral=True)
 
 class AttendCancelView(discord.ui.View):
-    def __init__(self, host_id: int):
-        super().__init__()
+    # Persistent: registered once with bot.add_view, with per-training state in TrainingStore
+    def __init__(self):
+        super().__init__(timeout=None)
         self.add_item(AttendButton())
-        self.add_item(CancelButton(host_id))
+        self.add_item(CancelButton())
 
 TRAINING_CHOICES = [
     app_commands.Choice(name="Basic Cadet - Trooper Training", value="Basic Cadet - Trooper Training"),
@@ -67,16 +180,28 @@ TRAINING_CHOICES = [
     app_commands.Choice(name="Master FTO Training", value="Master FTO Training"),
 ]
 
-def get_time_choices():
-    now = datetime.now()
+def guild_timezone(config: BotConfig, guild_id: int) -> tzinfo:
+    """Timezone trainings are scheduled in: the guild's ``timezone``, then the default one, then the host's."""
+    return config.guild(guild_id).timezone or datetime.now().astimezone().tzinfo
+
+def first_start_slot(now: datetime) -> datetime:
+    """Earliest selectable start: at least 1 hour from ``now``, rounded up to the half hour."""
     min_start = now + timedelta(hours=1)
-    minute = min_start.minute
-    if minute == 0:
-        start = min_start.replace(minute=0, second=0, microsecond=0)
-    elif minute <= 30:
-        start = min_start.replace(minute=30, second=0, microsecond=0)
-    else:
-        start = (min_start + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    start = min_start.replace(minute=0, second=0, microsecond=0)
+    while start < min_start:
+        start += timedelta(minutes=30)
+    return start
+
+# Maps timezone key -> (first slot, choices); rebuilt only when the half-hour slot moves
+_time_choice_cache = {}
+
+def get_time_choices(tz: tzinfo, now: Optional[datetime] = None):
+    now = now or datetime.now(tz)
+    start = first_start_slot(now)
+    key = getattr(tz, "key", None) or str(tz)
+    cached = _time_choice_cache.get(key)
+    if cached is not None and cached[0] == start:
+        return cached[1]
     end = start + timedelta(hours=2)
     options = []
     current = start
@@ -85,14 +210,118 @@ def get_time_choices():
         value = current.strftime("%H:%M")
         options.append(app_commands.Choice(name=label, value=value))
         current += timedelta(minutes=30)
+    _time_choice_cache[key] = (start, options)
     return options
 
+def filter_time_choices(choices, current: str):
+    """Choices whose label ("7:30 PM") or value ("19:30") starts with the typed text."""
+    typed = current.strip().lower()
+    if not typed:
+        return choices
+    return [c for c in choices if c.name.lower().startswith(typed) or c.value.startswith(typed)]
+
 class Training(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        print("Training cog loaded!")
-        self.scheduled_trainings = []
-        self.cleanup_task.start()
+        logger.info("Training cog loaded!")
+        self.store = TrainingStore(bot.CONFIG.get("training_store", "trainings.json"))
+        self.render_pending = {}  # Maps message id -> latest Message to re-render attendees on
+        self.render_tasks = set()  # Pending renders, referenced so they aren't garbage collected
+
+    async def cog_load(self):
+        self.bot.add_view(AttendCancelView())
+        self.bot.scheduler.register("training_expiry", self.expire_trainings)
+        self.reconcile_task = asyncio.create_task(self.reconcile_announcements())
+
+    async def cog_unload(self):
+        self.reconcile_task.cancel()
+
+    def cancel_expiry(self, message_id: int):
+        for job in self.bot.scheduler.pending("training_expiry"):
+            if job.data["message_id"] == message_id:
+                self.bot.scheduler.cancel(job.id)
+
+    async def expire_trainings(self, jobs):
+        # Trainings ending together are removed with one bulk delete per channel
+        by_channel = {}
+        for job in jobs:
+            guild = self.bot.get_guild(job.data["guild_id"])
+            if guild is not None and guild.unavailable:
+                # Outage; the announcement is still there, so delete it once the guild is back
+                self.bot.scheduler.retry(job)
+                continue
+            by_channel.setdefault(job.data["channel_id"], []).append(job.data["message_id"])
+        for channel_id, message_ids in by_channel.items():
+            for message_id in message_ids:
+                self.store.remove(message_id)
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            messages = [channel.get_partial_message(message_id) for message_id in message_ids]
+            for i in range(0, len(messages), 100):
+                chunk = messages[i:i + 100]
+                try:
+                    await channel.delete_messages(chunk)
+                except discord.HTTPException:
+                    # Bulk delete fails as a whole if any message is gone; retry one by one
+                    for message in chunk:
+                        try:
+                            await message.delete()
+                        except discord.NotFound:
+                            pass
+                        except discord.HTTPException as e:
+                            logger.error(f"Failed to delete expired training {message.id}: {e}")
+
+    async def reconcile_announcements(self):
+        """Schedule expiry for announcements posted before a restart that have no pending job."""
+        await self.bot.wait_until_ready()
+        tracked = {job.data["message_id"] for job in self.bot.scheduler.pending("training_expiry")}
+        for guild in self.bot.guilds:
+            channel = self.bot.config.channel(guild, "training_channel")
+            if channel is None:
+                continue
+            try:
+                async for message in channel.history(limit=RECONCILE_HISTORY_LIMIT):
+                    if message.author.id != self.bot.user.id or not message.embeds or message.id in tracked:
+                        continue
+                    end_time = training_end_time(message.embeds[0])
+                    if end_time is not None:
+                        # Already-past deadlines fire on the scheduler's next pass
+                        self.bot.scheduler.schedule("training_expiry", end_time, {"guild_id": guild.id, "channel_id": channel.id, "message_id": message.id})
+            except discord.HTTPException as e:
+                logger.error(f"Could not reconcile training announcements in {guild.id}: {e}")
+
+    def queue_render(self, message: discord.Message):
+        """Re-render the attendees field soon; clicks in the meantime share the same edit."""
+        first = message.id not in self.render_pending
+        self.render_pending[message.id] = message
+        if first:
+            task = asyncio.create_task(self.render_attendees(message.id))
+            self.render_tasks.add(task)
+            task.add_done_callback(self.render_tasks.discard)
+
+    async def render_attendees(self, message_id: int):
+        await asyncio.sleep(ATTENDEE_RENDER_DELAY)
+        # Clicks arriving while this edit is in flight queue the next one
+        message = self.render_pending.pop(message_id)
+        session = self.store.get(message_id)
+        if session is None:
+            return
+        self.store.save()
+        embed = message.embeds[0]
+        for i, field in enumerate(embed.fields):
+            if field.name.startswith(":busts_in_silhouette:"):
+                attendees = session["attendees"]
+                name = f":busts_in_silhouette: Attendees ({len(attendees)}):" if attendees else ":busts_in_silhouette: Attendees:"
+                embed.set_field_at(i, name=name, value=render_attendees(attendees), inline=False)
+                break
+        try:
+            # No deadline: the edit is already coalesced and carries the latest attendee list
+            await self.bot.outbound.call(
+                lambda: message.edit(embed=embed), priority=BACKGROUND, bucket=("channel", message.channel.id), label=f"attendees of {message_id}"
+            )
+        except discord.HTTPException as e:
+            logger.error(f"Failed to update attendees for {message_id}: {e}")
 
     @app_commands.command(name="training", description="Schedule a training session")
     @app_commands.describe(
@@ -106,14 +335,20 @@ class Training(commands.Cog):
         host_mention = interaction.user.mention
         host_id = interaction.user.id
 
-        now = datetime.now()
-        time_obj = datetime.strptime(start_time, "%H:%M")
+        tz = guild_timezone(self.bot.config, interaction.guild.id)
+        now = datetime.now(tz)
+        try:
+            time_obj = datetime.strptime(start_time, "%H:%M")
+        except ValueError:
+            await interaction.response.send_message("❌ Please pick a start time from the list.", ephemeral=True)
+            return
         start_dt = now.replace(hour=time_obj.hour, minute=time_obj.minute, second=0, microsecond=0)
         if start_dt < now:
             start_dt += timedelta(days=1)
 
+        # Same window the autocomplete offers
         min_time = now + timedelta(hours=1)
-        max_time = now + timedelta(hours=2, minutes=30)
+        max_time = first_start_slot(now) + timedelta(hours=2)
         if not (min_time <= start_dt <= max_time):
             await interaction.response.send_message(
                 f"❌ Please select a start time between "
@@ -131,7 +366,7 @@ class Training(commands.Cog):
         embed.set_author(name=f"{training_type.value} {emoji}")
         embed.add_field(
             name=":busts_in_silhouette: Attendees:",
-            value="Click the button below to sign up!",
+            value=ATTENDEES_PLACEHOLDER,
             inline=False
         )
         embed.add_field(
@@ -154,9 +389,9 @@ class Training(commands.Cog):
             inline=False
         )
 
-        view = AttendCancelView(host_id)
+        view = AttendCancelView()
 
-        target_channel = interaction.guild.get_channel(TARGET_CHANNEL_ID)
+        target_channel = self.bot.config.channel(interaction.guild, "training_channel")
         if not target_channel:
             await interaction.response.send_message("❌ Could not find the training announcements channel.", ephemeral=True)
             return
@@ -166,13 +401,13 @@ class Training(commands.Cog):
         except Exception as e:
             await interaction.response.send_message(f"❌ Failed to post training session: {e}", ephemeral=True)
             return
+        self.store.create(sent_message.id, host_id)
 
-        end_time = start_dt + timedelta(hours=2)
-
-        self.scheduled_trainings.append({
-            "message_id": sent_message.id,
+        end_time = start_dt + TRAINING_DURATION
+        self.bot.scheduler.schedule("training_expiry", end_time.timestamp(), {
+            "guild_id": target_channel.guild.id,
             "channel_id": target_channel.id,
-            "end_time": end_time,
+            "message_id": sent_message.id,
         })
 
         await interaction.response.send_message(
@@ -186,7 +421,23 @@ class Training(commands.Cog):
         # Only respond once to the autocomplete interaction
         if interaction.response.is_done():
             return
-        await interaction.response.send_autocomplete(get_time_choices())
+        tz = guild_timezone(self.bot.config, interaction.guild_id)
+        await interaction.response.autocomplete(filter_time_choices(get_time_choices(tz), current))
+
+def _benchmark(calls: int = 100_000):
+    """p50/p99 latency of building and filtering autocomplete choices, as done per keystroke."""
+    tz = guild_timezone(BotConfig({"timezone": "America/New_York"}), 0)
+    typed = ["", "1", "7:", "19", "8:30", "x"]
+    timings = []
+    for n in range(calls):
+        start = time.perf_counter_ns()
+        filter_time_choices(get_time_choices(tz), typed[n % len(typed)])
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    print(f"{calls} calls: p50 {timings[calls // 2] / 1000:.1f}us, p99 {timings[calls * 99 // 100] / 1000:.1f}us")
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(Training(bot)) 
\ No newline at end of file
+    await bot.add_cog(Training(bot))
+
+if __name__ == "__main__":
+    _benchmark()
\ No newline at end of file
@@ -0,0 +1,190 @@
+import asyncio
+import html
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+logger = logging.getLogger('discord_bot')
+
+HTML_HEADER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; background: #313338; color: #dbdee1; }}
+.msg {{ margin: 6px 0; }}
+.time {{ color: #949ba4; font-size: 0.8em; }}
+.author {{ font-weight: bold; color: #f2f3f5; }}
+.edited, .deleted {{ color: #949ba4; font-size: 0.8em; }}
+.deleted-msg {{ opacity: 0.5; text-decoration: line-through; }}
+</style></head><body>
+<h2>{title}</h2>
+"""
+HTML_FOOTER = "</body></html>\n"
+
+class TicketCapture:
+    """Per-ticket append-only message logs, written as messages arrive.
+
+    Each open ticket thread has ``<directory>/<guild id>-<thread id>.jsonl``
+    holding create, edit and delete records, so closing a ticket replays a local
+    file instead of fetching the thread history. The files double as the registry
+    of captured tickets; with ``owns_guild``, a process sharing the directory with
+    other clusters only picks up its own guilds' tickets.
+
+    Records are only buffered in memory on the event loop; a background task
+    appends them in batches on a dedicated thread. Call ``flush()`` before
+    reading a ticket's file.
+    """
+
+    def __init__(self, directory: str, *, flush_interval: float = 0.5, owns_guild=None):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self.tickets = {}  # Maps thread id -> guild id for every captured ticket of this process
+        for name in os.listdir(directory):
+            guild_id, _, thread_id = name[:-len(".jsonl")].partition("-")
+            if not (name.endswith(".jsonl") and guild_id.isdigit() and thread_id.isdigit()):
+                continue
+            if owns_guild is None or owns_guild(int(guild_id)):
+                self.tickets[int(thread_id)] = int(guild_id)
+        self._pending = {}  # Maps thread id -> JSON lines not yet written
+        # One thread, so writes and removals of a ticket's file happen in the order they were queued
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-capture")
+        self._writer = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    def path(self, thread_id: int) -> str:
+        return os.path.join(self.directory, f"{self.tickets[thread_id]}-{thread_id}.jsonl")
+
+    def open(self, thread_id: int, guild_id: int):
+        # The file is created by the next flush
+        self.tickets[thread_id] = guild_id
+        self._pending.setdefault(thread_id, [])
+
+    def discard(self, thread_id: int):
+        guild_id = self.tickets.pop(thread_id, None)
+        self._pending.pop(thread_id, None)
+        if guild_id is not None:
+            self._executor.submit(self._remove, os.path.join(self.directory, f"{guild_id}-{thread_id}.jsonl"))
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _append(self, thread_id: int, record: dict):
+        self._pending.setdefault(thread_id, []).append(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _write(self, batches: dict):
+        for path, lines in batches.items():
+            with open(path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        # Paths resolved on the loop, while every pending thread is still registered
+        batches = {self.path(thread_id): lines for thread_id, lines in self._pending.items() if thread_id in self.tickets}
+        self._pending = {}
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batches)
+
+    async def _write_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error(f"Failed to write ticket capture logs: {e}")
+
+    def record_message(self, thread_id: int, message_id: int, created_at: datetime, author: str, author_id: int, content: str, attachments=()):
+        self._append(thread_id, {
+            "op": "create", "id": message_id, "ts": created_at.timestamp(),
+            "author": author, "author_id": author_id, "content": content,
+            "attachments": list(attachments),
+        })
+
+    def record_edit(self, thread_id: int, message_id: int, content: str):
+        self._append(thread_id, {"op": "edit", "id": message_id, "ts": datetime.now(timezone.utc).timestamp(), "content": content})
+
+    def record_delete(self, thread_id: int, message_id: int):
+        self._append(thread_id, {"op": "delete", "id": message_id, "ts": datetime.now(timezone.utc).timestamp()})
+
+    def replay(self, thread_id: int) -> list:
+        """Fold the log into the final list of messages, oldest first."""
+        messages = {}
+        with open(self.path(thread_id), 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                op = record.pop("op")
+                if op == "create":
+                    record.update(edited=None, deleted=None)
+                    messages[record["id"]] = record
+                elif record["id"] in messages:
+                    message = messages[record["id"]]
+                    if op == "edit":
+                        message["content"] = record["content"]
+                        message["edited"] = record["ts"]
+                    elif op == "delete":
+                        message["deleted"] = record["ts"]
+        return list(messages.values())
+
+    def text_lines(self, thread_id: int):
+        """Yield the plain-text transcript one line at a time, e.g. for indexing."""
+        for message in self.replay(thread_id):
+            yield render_text(message)
+
+    def export(self, thread_id: int, fmt: str, out, title: str = "Ticket transcript"):
+        """Write the ticket's transcript to binary file ``out`` as ``txt``, ``jsonl`` or ``html``."""
+        messages = self.replay(thread_id)
+        if fmt == "jsonl":
+            for message in messages:
+                out.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        elif fmt == "html":
+            out.write(HTML_HEADER.format(title=html.escape(title)).encode("utf-8"))
+            for message in messages:
+                out.write(render_html(message).encode("utf-8"))
+            out.write(HTML_FOOTER.encode("utf-8"))
+        else:
+            for message in messages:
+                out.write(render_text(message).encode("utf-8") + b"\n")
+        if not messages:
+            out.write(b"No messages found.")
+
+def _timestamp(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def render_text(message: dict) -> str:
+    content = message["content"]
+    for attachment in message["attachments"]:
+        content += f" [{attachment}]"
+    if message["edited"]:
+        content += " (edited)"
+    if message["deleted"]:
+        content += " (deleted)"
+    return f"[{_timestamp(message['ts'])}] {message['author']}: {content}"
+
+def render_html(message: dict) -> str:
+    content = html.escape(message["content"]).replace("\n", "<br>")
+    for attachment in message["attachments"]:
+        url = html.escape(attachment)
+        content += f' <a href="{url}">{url}</a>'
+    classes = "msg deleted-msg" if message["deleted"] else "msg"
+    notes = ""
+    if message["edited"]:
+        notes += ' <span class="edited">(edited)</span>'
+    if message["deleted"]:
+        notes += ' <span class="deleted">(deleted)</span>'
+    return (
+        f'<div class="{classes}"><span class="time">{_timestamp(message["ts"])}</span> '
+        f'<span class="author">{html.escape(message["author"])}</span>: {content}{notes}</div>\n'
+    )
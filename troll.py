@@ -2,13 +2,112 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
+import json
+import logging
+import os
 import random
+import time
+from outbound import BACKGROUND
+
+logger = logging.getLogger('discord_bot')
+
+# Seconds a ghost relay or mimic reply may wait in the outbound queue before it's pointless
+TROLL_SEND_TTL = 10.0
+# A webhooks update this soon after the bot created a channel's webhook is taken to be that creation's own echo
+OWN_WEBHOOK_UPDATE_WINDOW = 10.0
 
 class TrollCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.ghosting = {}  # Maps user_id (controller) -> member to mimic
-        self.processed_messages = set()  # Track processed messages
+        self.ghosting = {}  # Maps user_id (controller) -> {"name", "avatar_url"} of the member to mimic
+        self.webhooks = {}  # Maps channel id -> GhostWebhook for that channel
+        self.webhook_locks = {}  # Maps channel id -> lock held while looking up or creating its webhook
+        self.own_webhook_updates = {}  # Maps channel id -> deadline for the update our create_webhook causes
+        self.webhook_store = bot.CONFIG.get("ghost_webhook_store")  # Optional JSON file to keep webhooks across restarts
+        self.load_webhooks()
+
+    async def cog_load(self):
+        pipeline = self.bot.message_pipeline
+        pipeline.register("troll.ghost", self.is_ghosted, self.relay_ghosted)
+        pipeline.register("troll.mimic", self.is_mimicable, self.mimic)
+        if self.bot.ipc is not None:
+            # Ghosting follows the controller into guilds served by other cluster processes
+            await self.bot.ipc.watch("ghosting:", self.apply_ghosting_change)
+            for key, target in (await self.bot.ipc.items("ghosting:")).items():
+                self.apply_ghosting_change(key, target)
+
+    async def cog_unload(self):
+        self.bot.message_pipeline.unregister("troll.ghost")
+        self.bot.message_pipeline.unregister("troll.mimic")
+
+    def apply_ghosting_change(self, key: str, target):
+        user_id = int(key.split(":", 1)[1])
+        if target is None:
+            self.ghosting.pop(user_id, None)
+        else:
+            self.ghosting[user_id] = target
+
+    async def set_ghosting(self, user_id: int, target):
+        if self.bot.ipc is not None:
+            key = f"ghosting:{user_id}"
+            await (self.bot.ipc.set(key, target) if target is not None else self.bot.ipc.delete(key))
+        self.apply_ghosting_change(f"ghosting:{user_id}", target)
+
+    def load_webhooks(self):
+        if not self.webhook_store or not os.path.exists(self.webhook_store):
+            return
+        try:
+            with open(self.webhook_store, 'r', encoding='utf-8') as f:
+                urls = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load ghost webhooks: {e}")
+            return
+        for channel_id, url in urls.items():
+            self.webhooks[int(channel_id)] = discord.Webhook.from_url(url, client=self.bot)
+
+    def save_webhooks(self):
+        if not self.webhook_store:
+            return
+        tmp_path = f"{self.webhook_store}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(channel_id): webhook.url for channel_id, webhook in self.webhooks.items()}, f)
+        os.replace(tmp_path, self.webhook_store)
+
+    def forget_webhook(self, channel_id: int):
+        if self.webhooks.pop(channel_id, None) is not None:
+            self.save_webhooks()
+
+    async def get_ghost_webhook(self, channel) -> discord.Webhook:
+        webhook = self.webhooks.get(channel.id)
+        if webhook is not None:
+            return webhook
+        # Concurrent first relays in a channel would otherwise each create a webhook
+        async with self.webhook_locks.setdefault(channel.id, asyncio.Lock()):
+            webhook = self.webhooks.get(channel.id)
+            if webhook is not None:
+                return webhook
+            # Only a webhook we own carries a token we can send with
+            webhooks = await channel.webhooks()
+            webhook = discord.utils.find(lambda w: w.name == "GhostWebhook" and w.token, webhooks)
+            if webhook is None:
+                # Set first: the gateway may deliver the update before the REST call returns
+                self.own_webhook_updates[channel.id] = time.monotonic() + OWN_WEBHOOK_UPDATE_WINDOW
+                try:
+                    webhook = await channel.create_webhook(name="GhostWebhook")
+                except discord.HTTPException:
+                    self.own_webhook_updates.pop(channel.id, None)
+                    raise
+            self.webhooks[channel.id] = webhook
+            self.save_webhooks()
+        return webhook
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel):
+        deadline = self.own_webhook_updates.pop(channel.id, None)
+        if deadline is not None and time.monotonic() < deadline:
+            return  # Caused by our own create_webhook; the cache is fresh
+        # The cached webhook may have been deleted or edited; look it up again on next use
+        self.forget_webhook(channel.id)
 
     # /ghostping
     @app_commands.command(name="ghostping", description="Ghost ping a user then delete it.")
@@ -67,7 +166,7 @@ class TrollCommands(commands.Cog):
     # /ghost - start ghost typing as a user
     @app_commands.command(name="ghost", description="Start ghost typing as a mentioned user.")
     async def ghost(self, interaction: discord.Interaction, member: discord.Member):
-        self.ghosting[interaction.user.id] = member
+        await self.set_ghosting(interaction.user.id, {"name": member.display_name, "avatar_url": member.display_avatar.url})
         await interaction.response.send_message(
             f"You are now ghost typing as {member.display_name}. Your messages will be sent as them and your originals deleted."
         )
@@ -76,61 +175,55 @@ class TrollCommands(commands.Cog):
     @app_commands.command(name="ghost_stop", description="Stop ghost typing.")
     async def ghost_stop(self, interaction: discord.Interaction):
         if interaction.user.id in self.ghosting:
-            del self.ghosting[interaction.user.id]
+            await self.set_ghosting(interaction.user.id, None)
             await interaction.response.send_message("Stopped ghost typing.")
         else:
             await interaction.response.send_message("You are not ghost typing anyone.")
 
-    # Mimic ghost typing + original mimic listener
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
-            return
+    # Ghost typing mimic using webhook impersonation and delete original message
+    def is_ghosted(self, message) -> bool:
+        return message.author.id in self.ghosting and len(message.content) > 0 and message.guild is not None
 
-        # Create a unique identifier for this message
-        message_id = f"{message.id}_{message.channel.id}"
-        
-        # Check if we've already processed this message
-        if message_id in self.processed_messages:
-            print(f"DEBUG: Message {message_id} already processed, skipping")
-            return
-            
-        # Add to processed set
-        self.processed_messages.add(message_id)
-        print(f"DEBUG: Processing message {message_id} from {message.author.name}: {message.content}")
-        
-        # Clean up old message IDs (keep only last 1000)
-        if len(self.processed_messages) > 1000:
-            self.processed_messages.clear()
-
-        # Ghost typing mimic using webhook impersonation and delete original message
-        if message.author.id in self.ghosting:
-            target = self.ghosting[message.author.id]
-            if len(message.content) > 0 and message.guild:
-                try:
-                    # Get or create webhook named "GhostWebhook" for this channel
-                    webhooks = await message.channel.webhooks()
-                    webhook = discord.utils.get(webhooks, name="GhostWebhook")
-                    if webhook is None:
-                        webhook = await message.channel.create_webhook(name="GhostWebhook")
+    async def relay_ghosted(self, message):
+        # Queued as one job rather than awaited, so a backed-up outbound queue doesn't stall the message pipeline
+        target = self.ghosting[message.author.id]
+        self.bot.outbound.submit(
+            lambda: self.send_ghosted(message, target),
+            priority=BACKGROUND, bucket=("webhook", message.channel.id), ttl=TROLL_SEND_TTL, label="ghost relay",
+        )
 
-                    # Send the message as the target user via webhook
+    async def send_ghosted(self, message, target):
+        try:
+            # Send the message as the target user via the channel's cached webhook,
+            # fetching a fresh one once if the cached webhook was deleted
+            for attempt in range(2):
+                webhook = await self.get_ghost_webhook(message.channel)
+                try:
                     await webhook.send(
                         content=message.content,
-                        username=target.display_name,
-                        avatar_url=target.display_avatar.url,
+                        username=target["name"],
+                        avatar_url=target["avatar_url"],
                     )
-                    # Delete original message to keep ghost effect
-                    await message.delete()
-                except Exception as e:
-                    print(f"Error in ghost typing: {e}")
-
-        # Original mimic behavior
-        if "?" not in message.content and len(message.content) > 5 and random.random() < 0.1:
-            await message.channel.send(f"{message.content.lower()} 🤓")
-            
-        # Process commands (required for text commands to work)
-        await self.bot.process_commands(message)
+                    break
+                except discord.NotFound:
+                    self.forget_webhook(message.channel.id)
+                    if attempt:
+                        raise
+            # Delete original message to keep ghost effect
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Error in ghost typing: {e}")
+
+    # Original mimic behavior
+    def is_mimicable(self, message) -> bool:
+        return len(message.content) > 5 and "?" not in message.content
+
+    async def mimic(self, message):
+        if random.random() < 0.1:
+            self.bot.outbound.submit(
+                lambda: message.channel.send(f"{message.content.lower()} 🤓"),
+                priority=BACKGROUND, bucket=("channel", message.channel.id), ttl=TROLL_SEND_TTL, label="mimic",
+            )
 
 async def setup(bot):
     await bot.add_cog(TrollCommands(bot))